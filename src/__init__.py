@@ -11,13 +11,6 @@ to standard output.
 
 """
 
-try:
-    # So many broken ctypeses out there.
-    import ctypes
-    import struct
-except ImportError:
-    ctypes = None
-
 try:
     import os
 except ImportError:
@@ -27,88 +20,168 @@ import sys
 import time
 
 try:
-    from datetime import datetime
-except ImportError:
-    datetime = None
-
-try:
-    # RISC OS only.
-    import swi
-except ImportError:
-    pass
-
-try:
-    # Mac OS, Python <3 only.
-    import MacOS
+    from _thread import allocate_lock, get_ident
 except ImportError:
-    pass
+    try:
+        from thread import allocate_lock, get_ident
+    except ImportError:
+        from dummy_thread import allocate_lock, get_ident
 
+# The C extension, if it's been built. Anything it doesn't have (because it
+# isn't there, or is an older build) answers None.
 try:
-    from uptime._posix import _uptime_posix, _uptime_osx
+    from . import _posix
 except ImportError:
-    _uptime_posix = lambda: None
-    _uptime_osx = lambda: None
-
-__all__ = ['uptime', 'boottime']
+    _posix = None
+_uptime_posix = getattr(_posix, '_uptime_posix', lambda: None)
+_uptime_osx = getattr(_posix, '_uptime_osx', lambda: None)
+_uptime_clock = getattr(_posix, '_uptime_clock', lambda: None)
+_uptime_sysinfo = getattr(_posix, '_uptime_sysinfo', lambda: None)
+_clock_ns = getattr(_posix, '_uptime_clock_ns', lambda: None)
+_clock_watch_fd = getattr(_posix, '_clock_watch_fd', lambda: None)
+_sysinfo = getattr(_posix, '_sysinfo', lambda: None)
+
+__all__ = ['uptime', 'boottime', 'uptime_ns', 'boottime_ns', 'backend',
+           'reset', 'anchor', 'persist', 'watch', 'unwatch', 'instrument',
+           'stats', 'snapshot', 'metrics', 'write_metrics', 'serve',
+           'format_uptime', 'async_uptime', 'async_boottime',
+           'process_times', 'procfs_times', 'boot_history', 'boot_index',
+           'load_boot_index']
 
 __boottime = None
+__backend = None
+__backend_func = None
+
+# Held while probing (and while anchoring or resetting), so that only one
+# thread does it at a time. Reading what it found doesn't need it.
+__lock = allocate_lock()
+
+# Anchored mode; see anchor(). The anchor is (uptime, monotonic clock, boot
+# time), in seconds, plus the same in nanoseconds (the boot time since the
+# epoch) if there's a time.monotonic_ns.
+_monotonic = getattr(time, 'monotonic', None)
+_monotonic_ns = getattr(time, 'monotonic_ns', None)
+_time_ns = getattr(time, 'time_ns', None)
+__anchored = False
+__anchor = None
+
+# The cache file, if any, and the boot id it's for; see persist().
+# __persisted is the (backend, boot time) it's known to hold.
+__persist = None
+__boot_id = None
+__persisted = None
+
+# How far a cached boot time can be from what the backend says and still be
+# trusted: /proc/stat's btime is rounded down to the second, and drifts a
+# little as NTP slews the clock.
+_PERSIST_SLACK = 2
+
+# The thread that notices the clock being set or the system resuming, if
+# it's running, and who to tell; see watch().
+__watcher = None
+__watch_callbacks = []
+
+# Instrumentation; see instrument(). While it's off, none of this is touched.
+_timer = getattr(time, 'perf_counter', time.time)
+_audit = getattr(sys, 'audit', None)
+__instrumented = False
+__hook = None
+__stats = {}
+__stats_lock = allocate_lock()
+
+# The thread that holds __lock while calling backends, if any. What the hook
+# (and the audit hook) would be told meanwhile waits in __pending until it's
+# let go, so that they can call back into the module without deadlocking.
+__holder = None
+__pending = []
+# The threads that are in the hook right now. Calls the hook makes to
+# backends itself are counted, but not passed back to it.
+__notifying = set()
+
+# The datetime class, once _datetime() has imported it. Set it to None to
+# pretend there isn't one.
+_UNLOADED = object()
+datetime = _UNLOADED
+
+# The platform modules _uptime_mac() and _uptime_riscos() need, once they've
+# tried to import them, or None if there aren't any. Looking for a module
+# that isn't there means going through all of sys.path every time.
+_MacOS = _UNLOADED
+_swi = _UNLOADED
+
+# How many pids each worker thread handles at a time in process_times().
+_PIDS_PER_TASK = 256
+
+# Which backends to try first on which platform. Anything not listed here
+# starts with _uptime_clock and _uptime_bsd.
+_PLATFORM_BACKENDS = {'amiga': ('amiga',),
+                      'aros12': ('amiga',),
+                      'beos5': ('beos',),
+                      'cygwin': ('clock', 'linux'),
+                      'darwin': ('osx',),
+                      'haiku1': ('beos',),
+                      'linux': ('clock', 'linux'),
+                      'linux-armv71': ('clock', 'linux'),
+                      'linux2': ('clock', 'linux'),
+                      'mac': ('mac',),
+                      'minix3': ('minix',),
+                      'riscos': ('riscos',),
+                      'sunos5': ('solaris',),
+                      'syllable': ('syllable',),
+                      'win32': ('windows',),
+                      'wince': ('windows',)}
+
+# The backends whose answer is worked out from the boot time anyway. Once
+# that's known, uptime() works it out the same way instead of asking them
+# again; the others are always asked, since they read a clock directly.
+_BOOTTIME_BACKENDS = ('amiga', 'bsd', 'osx', 'posix', 'solaris', 'syllable')
+
+# The order in which the remaining backends are tried if the platform's own
+# ones come up empty.
+_PROBE_ORDER = ('bsd', 'clock', 'plan9', 'linux', 'windows', 'solaris',
+                'beos', 'amiga', 'riscos', 'posix', 'syllable', 'mac', 'osx')
+
+def _datetime():
+    """
+    Returns the datetime class, importing it the first time round, or raises
+    RuntimeError if there isn't one.
+    """
+    global datetime
+    if datetime is _UNLOADED:
+        try:
+            from datetime import datetime
+        except ImportError:
+            datetime = None
+    if datetime is None:
+        raise RuntimeError('datetime module required.')
+    return datetime
 
-def _uptime_linux():
+def _uptime_linux(procfs='/proc'):
     """Returns uptime in seconds or None, on Linux."""
+    from . import _procfs
     # With procfs
-    try:
-        f = open('/proc/uptime', 'r')
-        up = float(f.readline().split()[0])
-        f.close()
+    up = _procfs.uptime_linux(procfs)
+    if up is not None or procfs != _procfs.PROCFS:
         return up
-    except (IOError, ValueError):
-        pass
 
     # Without procfs (really?)
-    try:
-        libc = ctypes.CDLL('libc.so')
-    except AttributeError:
-        return None
-    except OSError:
-        # Debian and derivatives do the wrong thing because /usr/lib/libc.so
-        # is a GNU ld script rather than an ELF object. To get around this, we
-        # have to be more specific.
-        # We don't want to use ctypes.util.find_library because that creates a
-        # new process on Linux. We also don't want to try too hard because at
-        # this point we're already pretty sure this isn't Linux.
-        try:
-            libc = ctypes.CDLL('libc.so.6')
-        except OSError:
-            return None
-
-    if not hasattr(libc, 'sysinfo'):
-        # Not Linux.
-        return None
+    up = _uptime_sysinfo()
+    if up is not None:
+        return up
 
-    buf = ctypes.create_string_buffer(128) # 64 suffices on 32-bit, whatever.
-    if libc.sysinfo(buf) < 0:
-        return None
+    from . import _native
+    return _native.uptime_linux()
 
-    up = struct.unpack_from('@l', buf.raw)[0]
-    if up < 0:
-        up = None
-    return up
-
-def _boottime_linux():
+def _boottime_linux(procfs='/proc'):
     """A way to figure out the boot time directly on Linux."""
     global __boottime
-    try:
-        f = open('/proc/stat', 'r')
-        for line in f:
-            if line.startswith('btime'):
-                __boottime = int(line.split()[1])
-
-        if datetime is None:
-            raise NotImplementedError('datetime module required.')
-
-        return datetime.fromtimestamp(__boottime)
-    except (IOError, IndexError):
+    from . import _procfs
+    bt = _procfs.boottime_linux(procfs)
+    if bt is None:
         return None
+    if procfs == _procfs.PROCFS:
+        __boottime = bt
+    return _datetime().fromtimestamp(bt)
 
 def _uptime_amiga():
     """Returns uptime in seconds or None, on AmigaOS."""
@@ -121,53 +194,18 @@ def _uptime_amiga():
 
 def _uptime_beos():
     """Returns uptime in seconds on None, on BeOS/Haiku."""
-    try:
-        libroot = ctypes.CDLL('libroot.so')
-    except (AttributeError, OSError):
-        return None
-
-    if not hasattr(libroot, 'system_time'):
-        return None
-
-    libroot.system_time.restype = ctypes.c_int64
-    return libroot.system_time() / 1000000.
+    from . import _native
+    return _native.uptime_beos()
 
 def _uptime_bsd():
     """Returns uptime in seconds or None, on BSD (including OS X)."""
     global __boottime
-    try:
-        libc = ctypes.CDLL('libc.so')
-    except AttributeError:
+    from . import _native
+    bt = _native.boottime_bsd()
+    if bt is None:
         return None
-    except OSError:
-        # OS X; can't use ctypes.util.find_library because that creates
-        # a new process on Linux, which is undesirable.
-        try:
-            libc = ctypes.CDLL('libc.dylib')
-        except OSError:
-            return None
 
-    if not hasattr(libc, 'sysctlbyname'):
-        # Not BSD.
-        return None
-
-    # Determine how much space we need for the response.
-    sz = ctypes.c_uint(0)
-    libc.sysctlbyname('kern.boottime', None, ctypes.byref(sz), None, 0)
-    if sz.value != struct.calcsize('@LL'):
-        # Unexpected, let's give up.
-        return None
-
-    # For real now.
-    buf = ctypes.create_string_buffer(sz.value)
-    libc.sysctlbyname('kern.boottime', buf, ctypes.byref(sz), None, 0)
-    sec, usec = struct.unpack('@LL', buf.raw)
-
-    # OS X disagrees what that second value is.
-    if usec > 1000000:
-        usec = 0.
-
-    __boottime = sec + usec / 1000000.
+    __boottime = bt
     up = time.time() - __boottime
     if up < 0:
         up = None
@@ -175,119 +213,61 @@ def _uptime_bsd():
 
 def _uptime_mac():
     """Returns uptime in seconds or None, on Mac OS."""
-    try:
-        # Python docs say a clock tick is 1/60th of a second, Mac OS docs say
-        # it's ``approximately'' 1/60th. It's incremented by vertical retraces,
-        # which the Macintosh Plus docs say happen 60.15 times per second.
-        # I don't know if ``approximately'' means it's actually 1/60.15, or
-        # 1/60 on some machines and 1/60.15 on others.
-        return MacOS.GetTicks() / 60.15
-    except NameError:
+    global _MacOS
+    if _MacOS is _UNLOADED:
+        try:
+            # Mac OS, Python <3 only.
+            import MacOS as _MacOS
+        except ImportError:
+            _MacOS = None
+    if _MacOS is None:
         return None
 
-def _uptime_minix():
+    # Python docs say a clock tick is 1/60th of a second, Mac OS docs say
+    # it's ``approximately'' 1/60th. It's incremented by vertical retraces,
+    # which the Macintosh Plus docs say happen 60.15 times per second.
+    # I don't know if ``approximately'' means it's actually 1/60.15, or
+    # 1/60 on some machines and 1/60.15 on others.
+    return _MacOS.GetTicks() / 60.15
+
+def _uptime_minix(procfs='/proc'):
     """Returns uptime in seconds or None, on MINIX."""
-    try:
-        f = open('/proc/uptime', 'r')
-        up = float(f.read())
-        f.close()
-        return up
-    except (IOError, ValueError):
-        return None
+    from . import _procfs
+    return _procfs.uptime_minix(procfs)
 
 def _uptime_plan9():
     """Returns uptime in seconds or None, on Plan 9."""
-    # Apparently Plan 9 only has Python 2.2, which I'm not prepared to
-    # support. Maybe some Linuxes implement /dev/time, though, someone was
-    # talking about it somewhere.
-    try:
-        # The time file holds one 32-bit number representing the sec-
-        # onds since start of epoch and three 64-bit numbers, repre-
-        # senting nanoseconds since start of epoch, clock ticks, and
-        # clock frequency.
-        #  -- cons(3)
-        f = open('/dev/time', 'r')
-        s, ns, ct, cf = f.read().split()
-        f.close()
-        return float(ct) / float(cf)
-    except (IOError, ValueError):
-        return None
+    from . import _procfs
+    return _procfs.uptime_plan9()
 
 def _uptime_riscos():
     """Returns uptime in seconds or None, on RISC OS."""
-    try:
-        up = swi.swi('OS_ReadMonotonicTime', ';i')
-        if up < 0:
-            # Overflows after about eight months on 32-bit.
-            return None
-        return up / 100.
-    except NameError:
+    global _swi
+    if _swi is _UNLOADED:
+        try:
+            # RISC OS only.
+            import swi as _swi
+        except ImportError:
+            _swi = None
+    if _swi is None:
         return None
 
+    up = _swi.swi('OS_ReadMonotonicTime', ';i')
+    if up < 0:
+        # Overflows after about eight months on 32-bit.
+        return None
+    return up / 100.
+
 def _uptime_solaris():
     """Returns uptime in seconds or None, on Solaris."""
     global __boottime
-    try:
-        kstat = ctypes.CDLL('libkstat.so')
-    except (AttributeError, OSError):
+    from . import _native
+    bt = _native.boottime_solaris()
+    if bt is None:
         return None
 
-    # kstat doesn't have uptime, but it does have boot time.
-    # Unfortunately, getting at it isn't perfectly straightforward.
-    # First, let's pretend to be kstat.h
-
-    # Constant
-    KSTAT_STRLEN = 31   # According to every kstat.h I could find.
-
-    # Data structures
-    class anon_union(ctypes.Union):
-        # The ``value'' union in kstat_named_t actually has a bunch more
-        # members, but we're only using it for boot_time, so we only need
-        # the padding and the one we're actually using.
-        _fields_ = [('c', ctypes.c_char * 16),
-                    ('time', ctypes.c_int)]
-
-    class kstat_named_t(ctypes.Structure):
-        _fields_ = [('name', ctypes.c_char * KSTAT_STRLEN),
-                    ('data_type', ctypes.c_char),
-                    ('value', anon_union)]
-
-    # Function signatures
-    kstat.kstat_open.restype = ctypes.c_void_p
-    kstat.kstat_lookup.restype = ctypes.c_void_p
-    kstat.kstat_lookup.argtypes = [ctypes.c_void_p,
-                                   ctypes.c_char_p,
-                                   ctypes.c_int,
-                                   ctypes.c_char_p]
-    kstat.kstat_read.restype = ctypes.c_int
-    kstat.kstat_read.argtypes = [ctypes.c_void_p,
-                                 ctypes.c_void_p,
-                                 ctypes.c_void_p]
-    kstat.kstat_data_lookup.restype = ctypes.POINTER(kstat_named_t)
-    kstat.kstat_data_lookup.argtypes = [ctypes.c_void_p,
-                                        ctypes.c_char_p]
-
-    # Now, let's do something useful.
-
-    # Initialise kstat control structure.
-    kc = kstat.kstat_open()
-    if not kc:
-        return None
-
-    # We're looking for unix:0:system_misc:boot_time.
-    ksp = kstat.kstat_lookup(kc, 'unix', 0, 'system_misc')
-    if ksp and kstat.kstat_read(kc, ksp, None) != -1:
-        data = kstat.kstat_data_lookup(ksp, 'boot_time')
-        if data:
-            __boottime = data.contents.value.time
-
-    # Clean-up.
-    kstat.kstat_close(kc)
-
-    if __boottime is not None:
-        return time.time() - __boottime
-
-    return None
+    __boottime = bt
+    return time.time() - __boottime
 
 def _uptime_syllable():
     """Returns uptime in seconds or None, on Syllable."""
@@ -303,63 +283,731 @@ def _uptime_windows():
     Returns uptime in seconds or None, on Windows. Warning: may return
     incorrect answers after 49.7 days on versions older than Vista.
     """
-    if hasattr(ctypes, 'windll') and hasattr(ctypes.windll, 'kernel32'):
-        lib = ctypes.windll.kernel32
-    else:
+    from . import _native
+    return _native.uptime_windows()
+
+def _probe_order():
+    """Returns the names of the backends uptime() tries, in order."""
+    first = _PLATFORM_BACKENDS.get(sys.platform, ('clock', 'bsd'))
+    return first + tuple(b for b in _PROBE_ORDER if b not in first)
+
+def _probe():
+    """
+    Tries each backend in turn and remembers the first one that gives an
+    answer, so later calls can go straight to it. Threads that call this
+    while another is already probing wait for it and use what it found.
+    """
+    global __backend, __backend_func, __holder
+    __lock.acquire()
+    __holder = get_ident()
+    try:
+        # Someone may have beaten us to it while we were waiting.
+        if _from_boottime():
+            return time.time() - __boottime
+        if __backend_func is not None:
+            up = __backend_func()
+            if up:
+                return up
+
+        for name in _probe_order():
+            func = globals()['_uptime_' + name]
+            if __instrumented:
+                func = _instrumented(name, func)
+            up = func()
+            if up:
+                __backend, __backend_func = name, func
+                if __persist is not None:
+                    _save()
+                return up
+        return None
+    finally:
+        __holder = None
+        __lock.release()
+        _flush()
+
+def _instrumented(name, func):
+    """Wraps a backend so that each call to it is recorded."""
+    def call():
+        start = _timer()
         try:
-            # Windows CE uses the cdecl calling convention.
-            lib = ctypes.CDLL('coredll.lib')
-        except (AttributeError, OSError):
-            return None
+            up = func()
+        except Exception:
+            e = sys.exc_info()[1]
+            _record(name, _timer() - start, None,
+                    '%s: %s' % (type(e).__name__, e))
+            raise
+        _record(name, _timer() - start, up, None if up else 'no answer')
+        return up
+    return call
+
+def _record(name, elapsed, up, error):
+    """Adds a call to a backend to the statistics, and tells whoever cares."""
+    __stats_lock.acquire()
+    try:
+        st = __stats.get(name)
+        if st is None:
+            st = __stats[name] = {'calls': 0, 'failures': 0,
+                                  'total': 0., 'max': 0., 'error': None}
+        st['calls'] += 1
+        st['total'] += elapsed
+        if elapsed > st['max']:
+            st['max'] = elapsed
+        if error is not None:
+            st['failures'] += 1
+            st['error'] = error
+    finally:
+        __stats_lock.release()
+
+    if __hook is None and _audit is None:
+        return
+    event = (name, elapsed, up, error)
+    if __holder == get_ident():
+        __stats_lock.acquire()
+        try:
+            __pending.append(event)
+        finally:
+            __stats_lock.release()
+        return
+    _notify(event)
+
+def _flush():
+    """Tells whoever cares about the calls recorded while __lock was held."""
+    __stats_lock.acquire()
+    try:
+        events = __pending[:]
+        del __pending[:]
+    finally:
+        __stats_lock.release()
+    for event in events:
+        _notify(event)
+
+def _notify(event):
+    """Passes a recorded call to the hook and the audit hooks."""
+    me = get_ident()
+    if me in __notifying:
+        return
+    __notifying.add(me)
+    try:
+        if __hook is not None:
+            __hook(*event)
+        if _audit is not None:
+            _audit('uptime.probe', *event)
+    finally:
+        __notifying.discard(me)
+
+def _from_boottime():
+    """
+    Whether uptime() works the answer out from the boot time it already
+    knows, rather than asking the backend.
+    """
+    return __boottime is not None and __backend in _BOOTTIME_BACKENDS
+
+def _known():
+    """
+    Whether uptime() can answer without probing or reading anything: from
+    the anchor, from the boot time, or from the clock.
+    """
+    return __anchor is not None or _from_boottime() or __backend == 'clock'
+
+def _uptime():
+    """uptime(), minus anchored mode."""
+    if _from_boottime():
+        return time.time() - __boottime
+
+    if __backend_func is not None:
+        up = __backend_func()
+        if up:
+            return up
 
-    if hasattr(lib, 'GetTickCount64'):
-        # Vista/Server 2008 or later.
-        lib.GetTickCount64.restype = ctypes.c_uint64
-        return lib.GetTickCount64() / 1000.
-    if hasattr(lib, 'GetTickCount'):
-        # WinCE and Win2k or later; gives wrong answers after 49.7 days.
-        lib.GetTickCount.restype = ctypes.c_uint32
-        return lib.GetTickCount() / 1000.
-    return None
+    return _probe()
 
 def uptime():
     """Returns uptime in seconds if even remotely possible, or None if not."""
-    if __boottime is not None:
-        return time.time() - __boottime
+    global __anchor
+    if __anchor is not None:
+        return __anchor[0] + (_monotonic() - __anchor[1])
 
-    return {'amiga': _uptime_amiga,
-            'aros12': _uptime_amiga,
-            'beos5': _uptime_beos,
-            'cygwin': _uptime_linux,
-            'darwin': _uptime_osx,
-            'haiku1': _uptime_beos,
-            'linux': _uptime_linux,
-            'linux-armv71': _uptime_linux,
-            'linux2': _uptime_linux,
-            'mac': _uptime_mac,
-            'minix3': _uptime_minix,
-            'riscos': _uptime_riscos,
-            'sunos5': _uptime_solaris,
-            'syllable': _uptime_syllable,
-            'win32': _uptime_windows,
-            'wince': _uptime_windows}.get(sys.platform, _uptime_bsd)() or \
-           _uptime_bsd() or _uptime_plan9() or _uptime_linux() or \
-           _uptime_windows() or _uptime_solaris() or _uptime_beos() or \
-           _uptime_amiga() or _uptime_riscos() or _uptime_posix() or \
-           _uptime_syllable() or _uptime_mac() or _uptime_osx()
+    up = _uptime()
+    if up is not None and __anchored:
+        __lock.acquire()
+        try:
+            if __anchor is None:
+                mono = _monotonic()
+                bt = __boottime or time.time() - up
+                __anchor = (up, mono, bt, _anchor_ns(up, bt))
+        finally:
+            __lock.release()
+    return up
 
-def boottime():
-    """Returns boot time if remotely possible, or None if not."""
+def _anchor_ns(up, bt):
+    """
+    Returns the nanosecond half of an anchor for uptime up and boot time bt,
+    as (uptime, monotonic clock, boot time), or None if there's no
+    time.monotonic_ns. Exact where uptime_ns() and boottime_ns() would be.
+    """
+    if _monotonic_ns is None:
+        return None
+    up_ns = _clock_ns() if __backend == 'clock' else None
+    mono_ns = _monotonic_ns()
+    if up_ns is None:
+        return (int(round(up * 1000000000)), mono_ns,
+                int(round(bt * 1000000)) * 1000)
+    return up_ns, mono_ns, _time_ns() - up_ns
+
+def anchor(enable=True):
+    """
+    Switches anchored mode on or off. In anchored mode, the first successful
+    probe is paired with a reading of time.monotonic(), and from then on
+    uptime() and boottime() are worked out from the monotonic clock alone:
+    no more probing, and no surprises when the wall clock is stepped.
+    """
+    global __anchored, __anchor
+    if enable and _monotonic is None:
+        raise RuntimeError('time.monotonic required.')
+    __lock.acquire()
+    try:
+        __anchored = bool(enable)
+        __anchor = None
+    finally:
+        __lock.release()
+
+def persist(enable=True, path=None):
+    """
+    Switches the cache file on or off. While it's on, the backend uptime()
+    settles on and the boot time are saved to path (by default
+    $XDG_RUNTIME_DIR/uptime.cache, or /run/uptime.cache), along with the
+    boot id, and if the file already holds them for the current boot, they're
+    used instead of probing: the backend once it's answered, and the boot
+    time once it's been found to agree with that answer. Returns True, or
+    False if there's no boot id to go by, or path can't be written, in which
+    case nothing is cached.
+    """
+    global __persist, __boot_id, __persisted, __backend, __backend_func, \
+           __boottime, __holder
+    from . import _persist
+    __lock.acquire()
+    __holder = get_ident()
+    try:
+        __persist = __boot_id = __persisted = None
+        if not enable:
+            return False
+        key = _persist.boot_id()
+        if key is None:
+            return False
+        if path is None:
+            path = _persist.default_path()
+        if not _persist.writable(path):
+            return False
+        __persist, __boot_id = path, key
+
+        if __backend is None:
+            cached = _persist.load(path, key, _probe_order())
+            if cached is not None:
+                __persisted = cached
+                name, bt = cached
+                func = globals()['_uptime_' + name]
+                if __instrumented:
+                    func = _instrumented(name, func)
+                # The boot id doesn't change when the clock is set, so the
+                # boot time is checked against one answer from the backend
+                # before it's trusted. (Some backends find the boot time
+                # themselves while they're at it.)
+                up = func()
+                if up:
+                    __backend, __backend_func = name, func
+                    if bt is not None and __boottime is None and \
+                       abs(time.time() - up - bt) < _PERSIST_SLACK:
+                        __boottime = bt
+        _save()
+        return True
+    finally:
+        __holder = None
+        __lock.release()
+        _flush()
+
+def watch(callback=None):
+    """
+    Starts watching for the wall clock being set and the system resuming
+    from suspend, and adds callback, if given, to the functions to call when
+    either happens, as callback(event, seconds): event is 'suspend' (seconds
+    is how long the system was suspended) or 'clock' (seconds is how far the
+    clock was set, which may be negative). Either way, the boot time and the
+    anchor (see anchor()) are forgotten, and worked out afresh next time.
+    Returns True, or False if this system can't be watched (only Linux can).
+    """
+    global __watcher
+    __lock.acquire()
+    try:
+        if __watcher is not None and __watcher.closed:
+            # Its thread's given up (the timer couldn't be replaced), so it's
+            # started afresh, if it can be.
+            __watcher = None
+        if __watcher is None:
+            if _monotonic is None or _uptime_clock() is None:
+                return False
+            from . import _watch
+            watcher = _watch.Watcher(_clock_watch_fd, _uptime_clock,
+                                     _clock_changed)
+            if not watcher.start():
+                return False
+            __watcher = watcher
+        if callback is not None and callback not in __watch_callbacks:
+            __watch_callbacks.append(callback)
+        return True
+    finally:
+        __lock.release()
+
+def unwatch(callback=None):
+    """
+    Removes callback from the functions watch() calls, or, if it's None,
+    stops watching altogether and removes them all.
+    """
+    global __watcher
+    __lock.acquire()
+    try:
+        if callback is not None:
+            if callback in __watch_callbacks:
+                __watch_callbacks.remove(callback)
+            return
+        watcher, __watcher = __watcher, None
+        del __watch_callbacks[:]
+    finally:
+        __lock.release()
+    # Outside the lock, since the thread may be waiting for it.
+    if watcher is not None:
+        watcher.stop()
+
+def _clock_changed(event, seconds):
+    """What the watch() thread calls when the clock is set or on resume."""
+    global __boottime, __anchor
+    from . import _procfs
+    __lock.acquire()
+    try:
+        # /proc/stat's btime is the wall clock minus CLOCK_BOOTTIME, so it's
+        # moved too; and an anchor's monotonic clock didn't count the time
+        # spent suspended. The backend is still good.
+        __boottime = __anchor = None
+        _procfs.forget_boottime()
+        callbacks = list(__watch_callbacks)
+    finally:
+        __lock.release()
+    # One callback failing doesn't stop the others from hearing about it.
+    for callback in callbacks:
+        try:
+            callback(event, seconds)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+
+def _save():
+    """
+    Writes the backend and boot time to the cache file, if they're known and
+    it doesn't already have them. Writing is only tried once for each.
+    """
+    global __persisted
+    state = (__backend, __boottime)
+    if __persist is None or __backend is None or state == __persisted:
+        return
+    from . import _persist
+    __persisted = state
+    try:
+        _persist.dump(__persist, __boot_id, __backend, __boottime)
+    except (IOError, OSError):
+        pass
+
+def instrument(enable=True, hook=None):
+    """
+    Switches instrumentation on or off, and clears the statistics. While it's
+    on, every call uptime() makes to a backend is counted and timed (see
+    stats()), raises a 'uptime.probe' audit event on Pythons that have
+    sys.audit, and is passed to hook, if given, as hook(name, seconds,
+    result, error). error is None if the backend answered.
+    """
+    global __instrumented, __hook, __stats, __backend_func
+    __lock.acquire()
+    try:
+        __instrumented = bool(enable)
+        __hook = hook if enable else None
+        __stats = {}
+        if __backend is not None:
+            __backend_func = globals()['_uptime_' + __backend]
+            if enable:
+                __backend_func = _instrumented(__backend, __backend_func)
+    finally:
+        __lock.release()
+
+def stats():
+    """
+    Returns what instrumentation has found so far: a dict mapping the name of
+    each backend uptime() has called to a dict with the number of calls, how
+    many of them failed, the total and maximum time they took in seconds, and
+    the reason for the last failure (or None).
+    """
+    __stats_lock.acquire()
+    try:
+        return dict((name, dict(st)) for name, st in __stats.items())
+    finally:
+        __stats_lock.release()
+
+def backend():
+    """
+    Returns the name of the backend uptime() settled on (e.g. 'linux' for
+    _uptime_linux), or None if it hasn't found one yet.
+    """
+    return __backend
+
+def reset():
+    """
+    Forgets the backend and boot time found so far, so the next call to
+    uptime() or boottime() probes from scratch.
+    """
+    global __boottime, __backend, __backend_func, __anchor
+    __lock.acquire()
+    try:
+        __boottime = __backend = __backend_func = __anchor = None
+        # Only if something's loaded it; otherwise there's nothing to forget.
+        procfs = sys.modules.get(__name__ + '._procfs')
+        if procfs is not None:
+            procfs.forget_boottime()
+    finally:
+        __lock.release()
+
+def _boottime():
+    """boottime(), in seconds since the epoch rather than as a datetime."""
     global __boottime
 
-    if __boottime is None:
+    if __boottime is None or __anchored:
         up = uptime()
         if up is None:
             return None
+
+    if __anchor is not None:
+        return __anchor[2]
+
     if __boottime is None:
-        _boottime_linux()
+        from . import _procfs
+        bt = _procfs.boottime_linux()
+        if bt is not None:
+            __boottime = bt
+            if __persist is not None:
+                _save()
 
-    if datetime is None:
-        raise RuntimeError('datetime module required.')
+    return __boottime or time.time() - up
+
+def boottime():
+    """Returns boot time if remotely possible, or None if not."""
+    bt = _boottime()
+    if bt is None:
+        return None
+    return _datetime().fromtimestamp(bt)
+
+def uptime_ns():
+    """
+    Returns uptime in nanoseconds, as an int, or None if it can't be
+    determined. Exact if uptime() reads a clock for it, otherwise as precise
+    as uptime() is.
+    """
+    anchored = __anchor
+    if anchored is not None and anchored[3] is not None:
+        up_ns, mono_ns = anchored[3][:2]
+        return up_ns + (_monotonic_ns() - mono_ns)
+    # Exact if uptime() would read the clock anyway; otherwise, whatever
+    # uptime() says, so the two never disagree.
+    if anchored is None and __backend == 'clock':
+        up = _clock_ns()
+        if up is not None:
+            return up
+    up = uptime()
+    if up is None:
+        return None
+    return int(round(up * 1000000000))
+
+def boottime_ns():
+    """
+    Returns boot time in nanoseconds since the epoch, as an int, or None if
+    it can't be determined. Where uptime_ns() is exact, it's the wall clock
+    minus that, exactly; otherwise, it's boottime() to the microsecond.
+    """
+    if __backend is None or (__anchored and __anchor is None):
+        if uptime() is None:
+            return None
+    anchored = __anchor
+    if anchored is not None:
+        if anchored[3] is not None:
+            return anchored[3][2]
+    elif __backend == 'clock' and _time_ns is not None:
+        up = _clock_ns()
+        if up is not None:
+            return _time_ns() - up
+
+    bt = _boottime()
+    if bt is None:
+        return None
+    return int(round(bt * 1000000)) * 1000
+
+def snapshot(procfs='/proc'):
+    """
+    Returns a Snapshot of the uptime, the time spent idle (summed over all
+    CPUs), the ratio of its time each CPU has spent idle, the load averages
+    and the boot time, all read in one go, or None if even the uptime can't
+    be determined. Anything else that can't be determined is None.
+    """
+    from . import _procfs, _snapshot
+    # With procfs: one read each of three files.
+    snap = _procfs.snapshot_linux(procfs)
+    if snap is not None:
+        return _snapshot.Snapshot(*snap)
+    if procfs != _procfs.PROCFS:
+        return None
 
-    return datetime.fromtimestamp(__boottime or time.time() - up)
+    # Without procfs: one call to sysinfo.
+    info = _sysinfo()
+    if info is None:
+        from . import _native
+        info = _native.sysinfo_linux()
+    if info is not None:
+        up, load = info
+        return _snapshot.Snapshot(up, load=load, boottime=time.time() - up)
+
+    # Anywhere else, whatever there is.
+    up = uptime()
+    if up is None:
+        return None
+    try:
+        load = os.getloadavg()
+    except (NameError, AttributeError, OSError):
+        load = None
+    return _snapshot.Snapshot(up, load=load, boottime=_boottime())
+
+def format_uptime(up, style='verbose'):
+    """
+    Returns an uptime in seconds in words: '1 day, 2 hours, 3 minutes, 4.00
+    seconds' like python -m uptime says it, or '1d 2h 3m 4s' if style is
+    'compact'. Given a sequence or NumPy array of uptimes instead, returns a
+    list of strings. None stays None, as does NaN in a NumPy array; arrays
+    with more than one dimension raise ValueError.
+    """
+    from . import _format
+    try:
+        style = _format.STYLES[style]
+    except KeyError:
+        raise ValueError('unknown style: %r' % (style,))
+
+    try:
+        iter(up)
+    except TypeError:
+        return _format.format_one(up, style)
+    if type(up).__module__ == 'numpy':
+        return _format.format_array(up, style)
+    return _format.format_many(up, style)
+
+def metrics():
+    """
+    Returns the boot time and uptime in the OpenMetrics text format, as the
+    node_boot_time_seconds and uptime_seconds gauges, or None if they can't
+    be determined.
+    """
+    bt = _boottime()
+    up = uptime()
+    if bt is None or up is None:
+        return None
+    return _metric_families(bt, up) + '# EOF\n'
+
+def _metric_families(bt, up):
+    """metrics(), minus the # EOF, so more can be added."""
+    return ('# HELP node_boot_time_seconds Node boot time, in unixtime.\n'
+            '# TYPE node_boot_time_seconds gauge\n'
+            'node_boot_time_seconds %.6f\n'
+            '# HELP uptime_seconds Time since boot, in seconds.\n'
+            '# TYPE uptime_seconds gauge\n'
+            'uptime_seconds %.6f\n' % (bt, up))
+
+def write_metrics(path):
+    """
+    Writes metrics() to a file for node_exporter's textfile collector, and
+    returns True, or returns False if there are no metrics to write. The file
+    is replaced atomically, so readers never see half of it.
+    """
+    text = metrics()
+    if text is None:
+        return False
+
+    _replace_file(path, text.encode('ascii'))
+    return True
+
+def _replace_file(path, data):
+    """
+    Writes data to a temporary file next to path, then renames it over path,
+    so readers see either the old file or the new one, but never half of it.
+    """
+    import tempfile
+    # Somewhere on the same file system, and not ending in .prom.
+    dirname, basename = os.path.split(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix='.%s.' % basename, dir=dirname)
+    try:
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        os.chmod(tmp, 420) # 0644, like any other file.
+        getattr(os, 'replace', os.rename)(tmp, path)
+    except:
+        os.unlink(tmp)
+        raise
+
+def serve(port, host='', block=True):
+    """
+    Serves metrics() at /metrics and the uptime and boot time as JSON at
+    /uptime.json over HTTP, on the given port and host. The uptime is
+    determined once, when the server starts; every request after that is
+    answered from memory and the monotonic clock. /metrics also includes how
+    long the server has spent answering requests.
+
+    If block is true, this serves until interrupted. Otherwise, the server
+    runs in a daemon thread, and is returned so it can be shut down. Returns
+    None if the uptime can't be determined.
+    """
+    from . import _http
+    bt = _boottime()
+    up = uptime()
+    if bt is None or up is None:
+        return None
+
+    server = _http.Server((host, port), up, bt, _metric_families)
+    if block:
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+        return server
+
+    import threading
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+def async_uptime():
+    """
+    Coroutine version of uptime(), for asyncio. If the answer is already
+    known, it's returned straight away; otherwise the probing is done in the
+    event loop's default executor, and shared by everyone waiting for it.
+    Requires Python 3.5+.
+    """
+    from . import _aio
+    return _aio.call(uptime, _known())
+
+def async_boottime():
+    """Coroutine version of boottime(); see async_uptime()."""
+    from . import _aio
+    # _boottime() only calls uptime() if it has to.
+    return _aio.call(boottime, __anchor is not None or
+                               (__boottime is not None and not __anchored))
+
+def process_times(pids=None, workers=None, procfs='/proc'):
+    """
+    Yields (pid, start time, age) for each of the given pids, or for every
+    process if pids is None. Start times are in seconds since the epoch, ages
+    in seconds. Processes that don't exist are skipped. If workers is more
+    than one, /proc is read from that many threads. Linux only; yields
+    nothing elsewhere.
+    """
+    from . import _procfs
+    hz = _procfs.clock_ticks()
+    if procfs == _procfs.PROCFS:
+        up = uptime()
+    else:
+        up = _procfs.uptime_linux(procfs)
+    if not hz or up is None:
+        return
+    boot = time.time() - up
+    hz = float(hz)
+
+    if pids is None:
+        pids = _procfs.pids(procfs)
+
+    starttimes = lambda pids: _procfs.starttimes(pids, procfs)
+    if workers is not None and workers > 1:
+        starts = _fan_out(starttimes, pids, workers, _PIDS_PER_TASK)
+    else:
+        starts = starttimes(pids)
+
+    for pid, ticks in starts:
+        since = ticks / hz
+        yield pid, boot + since, up - since
+
+def procfs_times(roots, workers=None):
+    """
+    Reads uptime and boot time from each of a number of procfs mounts, and
+    returns a dict mapping each root to an (uptime in seconds, boot time in
+    seconds since the epoch) tuple. Either can be None if it can't be read.
+    If workers is more than one, the roots are read from that many threads.
+    """
+    from . import _procfs
+    def read(roots):
+        for root in roots:
+            yield root, (_procfs.uptime_linux(root),
+                         _procfs.boottime_linux(root))
+
+    if workers is not None and workers > 1:
+        return dict(_fan_out(read, roots, workers, 1))
+    return dict(read(roots))
+
+def boot_history(path=None):
+    """
+    Returns an iterator over the boot, shutdown and run level records in wtmp
+    (or path), as (kind, time in seconds since the epoch, run level) tuples,
+    oldest first. kind is 'boot', 'shutdown' or 'runlevel'; the run level is
+    None except for run level changes. The file is read a batch of records
+    at a time, as the iterator is consumed.
+    """
+    if _posix is None:
+        raise RuntimeError('_posix extension required.')
+    return _posix._boot_history(path)
+
+def boot_index(path=None):
+    """
+    Returns a BootIndex of the boot times recorded in wtmp plus the current
+    boot time, or of the boot times recorded in path, for finding out which
+    boot session a lot of timestamps fall in at once.
+    """
+    from . import _sessions
+    try:
+        boots = [when for kind, when, level in boot_history(path)
+                 if kind == 'boot']
+    except (RuntimeError, OSError):
+        if path is not None:
+            raise
+        boots = []
+    return _sessions.build(boots, _boottime() if path is None else None)
+
+def load_boot_index(path):
+    """Returns the BootIndex saved to path with its save() method."""
+    from . import _sessions
+    f = open(path, 'rb')
+    try:
+        return _sessions.loads(f.read())
+    finally:
+        f.close()
+
+def _fan_out(func, items, workers, per_task):
+    """
+    Splits items into batches of per_task, runs the generator function func
+    over each of them in a pool of worker threads, and yields the results in
+    order.
+    """
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError:
+        raise RuntimeError('concurrent.futures required.')
+
+    items = list(items)
+    batches = [items[i:i + per_task]
+               for i in range(0, len(items), per_task)]
+    pool = ThreadPoolExecutor(workers)
+    try:
+        for batch in pool.map(lambda b: list(func(b)), batches):
+            for result in batch:
+                yield result
+    finally:
+        pool.shutdown()
@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 
+import getopt
 import sys
 import time
 from uptime import *
+from uptime import _boottime
 
 try:
     import locale
@@ -10,31 +12,116 @@ try:
 except Exception:
     pass
 
-if __name__ == '__main__':
-    up = uptime()
+USAGE = '''\
+Usage: python -m uptime [-b] [--json] [--textfile PATH] [--watch INTERVAL]
+       python -m uptime --serve [HOST:]PORT
+
+  -b                Show the boot time instead of the uptime.
+  --json            Print JSON objects (one per line) instead.
+  --textfile PATH   Write boot time and uptime metrics to PATH instead, for
+                    node_exporter's textfile collector.
+  --watch INTERVAL  Keep running, and print a line (or rewrite PATH) every
+                    INTERVAL seconds.
+  --serve [HOST:]PORT
+                    Serve metrics at /metrics and JSON at /uptime.json over
+                    HTTP.
+'''
 
+def line(boot, as_json):
+    """Returns one line of output, or None if the uptime is unknown."""
+    up = uptime()
     if up is None:
-        sys.stderr.write('Unable to determine uptime. Patches welcome.\n')
-        sys.exit(1)
+        return None
+
+    if as_json:
+        # Straight from the epoch, rather than through local time, which
+        # can't tell the two 01:30s apart when the clocks go back.
+        return '{"uptime": %.6f, "boottime": %.6f}\n' % (up, _boottime())
+    if boot:
+        return boottime().strftime('Booted: %c.\n')
+    return 'Uptime: %s.\n' % format_uptime(up)
+
+def show(boot, as_json):
+    """Prints one line of output. Returns False if the uptime is unknown."""
+    out = line(boot, as_json)
+    if out is None:
+        return False
+    sys.stdout.write(out)
+    sys.stdout.flush()
+    return True
 
-    if '-b' not in sys.argv:
-        parts = []
+def fail():
+    sys.stderr.write('Unable to determine uptime. Patches welcome.\n')
+    sys.exit(1)
 
-        days, up = up // 86400, up % 86400
-        if days:
-            parts.append('%d day%s' % (days, 's' if days != 1 else ''))
+def _loop(interval, emit):
+    """Calls emit every interval seconds, until interrupted or it fails."""
+    try:
+        # Probe once, and take it from there with the monotonic clock.
+        anchor()
+    except RuntimeError:
+        pass
+    clock = getattr(time, 'monotonic', time.time)
 
-        hours, up = up // 3600, up % 3600
-        if hours:
-            parts.append('%d hour%s' % (hours, 's' if hours != 1 else ''))
+    next_tick = clock()
+    try:
+        while True:
+            if not emit():
+                fail()
 
-        minutes, up = up // 60, up % 60
-        if minutes:
-            parts.append('%d minute%s' % (minutes, 's' if minutes != 1 else ''))
+            # Stay on schedule, however long that took; if we've fallen
+            # behind anyway, carry on from now.
+            next_tick += interval
+            delay = next_tick - clock()
+            if delay < 0:
+                next_tick -= delay
+                delay = 0
+            time.sleep(delay)
+    except KeyboardInterrupt:
+        pass
 
-        if up or not parts:
-            parts.append('%.2f seconds' % up)
+def main(args):
+    try:
+        opts, args = getopt.getopt(args, 'bh',
+                                   ['watch=', 'json', 'textfile=', 'serve=',
+                                    'help'])
+        opts = dict(opts)
+        interval = None
+        if '--watch' in opts:
+            interval = float(opts['--watch'])
+            if interval <= 0:
+                raise ValueError(interval)
+        address = None
+        if '--serve' in opts:
+            host, sep, port = opts['--serve'].rpartition(':')
+            address = host, int(port)
+    except (getopt.GetoptError, ValueError):
+        sys.stderr.write(USAGE)
+        sys.exit(2)
 
-        sys.stdout.write('Uptime: %s.\n' % ', '.join(parts))
+    if '-h' in opts or '--help' in opts:
+        sys.stdout.write(USAGE)
+        return
+
+    if address is not None:
+        try:
+            if serve(address[1], address[0]) is None:
+                fail()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if '--textfile' in opts:
+        path = opts['--textfile']
+        emit = lambda: write_metrics(path)
     else:
-        sys.stdout.write(boottime().strftime('Booted: %c.\n'))
+        boot, as_json = '-b' in opts, '--json' in opts
+        emit = lambda: show(boot, as_json)
+
+    if interval is not None:
+        _loop(interval, emit)
+    elif not emit():
+        fail()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
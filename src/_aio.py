@@ -0,0 +1,31 @@
+"""
+The asyncio side of uptime.async_uptime and uptime.async_boottime. This
+needs Python 3.5 or later, which is why it lives on its own.
+"""
+
+import asyncio
+
+# Probes currently running in an executor, by event loop and function, so
+# that concurrent callers can share them.
+_inflight = {}
+
+async def call(func, inline):
+    """
+    Returns func(). If inline is true, func is called directly; otherwise, it
+    runs in the loop's default executor, and callers that turn up while it's
+    still running wait for the same call to finish rather than start their
+    own.
+    """
+    if inline:
+        return func()
+
+    loop = asyncio.get_event_loop()
+    key = (loop, func)
+    fut = _inflight.get(key)
+    if fut is None:
+        fut = loop.run_in_executor(None, func)
+        _inflight[key] = fut
+        fut.add_done_callback(lambda f: _inflight.pop(key, None))
+
+    # Shielded so one caller giving up doesn't cancel it for the others.
+    return await asyncio.shield(fut)
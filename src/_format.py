@@ -0,0 +1,67 @@
+"""
+Turns uptimes into words for uptime.format_uptime(): one at a time, or for a
+NumPy array, with the arithmetic done on the whole array at once.
+"""
+
+
+def _verbose(days, hours, minutes, seconds):
+    """'1 day, 2 hours, 3 minutes, 4.00 seconds', like python -m uptime."""
+    parts = []
+    if days:
+        parts.append('%d day%s' % (days, 's' if days != 1 else ''))
+    if hours:
+        parts.append('%d hour%s' % (hours, 's' if hours != 1 else ''))
+    if minutes:
+        parts.append('%d minute%s' % (minutes, 's' if minutes != 1 else ''))
+    if seconds or not parts:
+        parts.append('%.2f seconds' % seconds)
+    return ', '.join(parts)
+
+def _compact(days, hours, minutes, seconds):
+    """'1d 2h 3m 4s'."""
+    parts = []
+    if days:
+        parts.append('%dd' % days)
+    if hours:
+        parts.append('%dh' % hours)
+    if minutes:
+        parts.append('%dm' % minutes)
+    if int(seconds) or not parts:
+        parts.append('%ds' % seconds)
+    return ' '.join(parts)
+
+STYLES = {'verbose': _verbose, 'compact': _compact}
+
+def breakdown(up):
+    """Splits an uptime in seconds into days, hours, minutes and seconds."""
+    days, up = divmod(up, 86400)
+    hours, up = divmod(up, 3600)
+    minutes, seconds = divmod(up, 60)
+    return days, hours, minutes, seconds
+
+def format_one(up, style):
+    if up is None:
+        return None
+    return style(*breakdown(up))
+
+def format_many(ups, style):
+    return [None if up is None else style(*breakdown(up)) for up in ups]
+
+def format_array(ups, style):
+    """
+    format_many() for NumPy arrays: the arithmetic is done on the whole
+    array at once, and only the formatting is left for each element. NaN (or
+    anything else that isn't finite) is None, as None is in format_many().
+    """
+    import numpy
+    ups = numpy.asarray(ups, dtype=float)
+    if ups.ndim != 1:
+        raise ValueError('expected a one-dimensional array, not %d '
+                         'dimensions' % ups.ndim)
+    known = numpy.isfinite(ups)
+    days, ups = numpy.divmod(numpy.where(known, ups, 0.), 86400)
+    hours, ups = numpy.divmod(ups, 3600)
+    minutes, seconds = numpy.divmod(ups, 60)
+    texts = map(style, days.astype(int).tolist(), hours.astype(int).tolist(),
+                minutes.astype(int).tolist(), seconds.tolist())
+    return [text if ok else None for text, ok in zip(texts, known.tolist())]
@@ -0,0 +1,88 @@
+"""
+The HTTP server behind uptime.serve(): it answers /metrics (OpenMetrics) and
+/uptime.json from figures it was handed once, so scrapes never probe.
+"""
+
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+_clock = getattr(time, 'monotonic', time.time)
+_timer = getattr(time, 'perf_counter', time.time)
+
+OPENMETRICS = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    """
+    Answers every request from the uptime and boot time it was given when it
+    was started, plus however far the monotonic clock has moved on since.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, up, boot, render):
+        HTTPServer.__init__(self, address, Handler)
+        self.up, self.boot, self.start = up, boot, _clock()
+        self.render = render
+        self.requests = 0
+        self.seconds = 0.
+        self.lock = threading.Lock()
+
+    def uptime(self):
+        return self.up + (_clock() - self.start)
+
+    def record(self, seconds):
+        """Keeps track of how long requests take to answer."""
+        self.lock.acquire()
+        try:
+            self.requests += 1
+            self.seconds += seconds
+        finally:
+            self.lock.release()
+
+    def metrics(self):
+        return (self.render(self.boot, self.uptime()) +
+                '# HELP uptime_http_request_duration_seconds '
+                'Time spent answering HTTP requests.\n'
+                '# TYPE uptime_http_request_duration_seconds summary\n'
+                'uptime_http_request_duration_seconds_count %d\n'
+                'uptime_http_request_duration_seconds_sum %.9f\n'
+                '# EOF\n' % (self.requests, self.seconds))
+
+    def json(self):
+        return '{"uptime": %.6f, "boottime": %.6f}\n' % (self.uptime(),
+                                                        self.boot)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        start = _timer()
+        path = self.path.split('?', 1)[0]
+        if path == '/metrics':
+            status, ctype, body = 200, OPENMETRICS, self.server.metrics()
+        elif path == '/uptime.json':
+            status, ctype, body = 200, 'application/json', self.server.json()
+        else:
+            status, ctype, body = 404, 'text/plain', 'Not found.\n'
+
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.record(_timer() - start)
+
+    def log_message(self, format, *args):
+        # Scrapers come by far too often for this to be interesting.
+        pass
@@ -0,0 +1,237 @@
+"""
+Backends that call into shared libraries through ctypes: Linux (without
+procfs), BSD and OS X, BeOS/Haiku, Solaris and Windows.
+
+This module is only imported once one of them is actually needed, so that
+importing uptime doesn't drag ctypes in on platforms that don't need it.
+"""
+
+try:
+    # So many broken ctypeses out there.
+    import ctypes
+    import struct
+except ImportError:
+    ctypes = None
+
+# Shared libraries and function prototypes, loaded and declared at most once
+# per process. Failures are remembered as None.
+__libs = {}
+__funcs = {}
+__kstat_named_t = None
+
+def _cdll(*names):
+    """
+    Returns a ctypes.CDLL for the first of the named libraries that can be
+    loaded, or None if none of them can.
+    """
+    for name in names:
+        if name not in __libs:
+            try:
+                __libs[name] = ctypes.CDLL(name)
+            except (AttributeError, OSError):
+                __libs[name] = None
+        if __libs[name] is not None:
+            return __libs[name]
+    return None
+
+def _cfunc(lib, name, restype=None, argtypes=None):
+    """
+    Returns the named function from lib with its prototype declared, or None
+    if lib is None or doesn't have it.
+    """
+    if lib is None:
+        return None
+    key = (lib._name, name)
+    if key not in __funcs:
+        func = getattr(lib, name, None)
+        if func is not None:
+            if restype is not None:
+                func.restype = restype
+            if argtypes is not None:
+                func.argtypes = argtypes
+        __funcs[key] = func
+    return __funcs[key]
+
+def _kstat_named_t():
+    """
+    Declares (enough of) kstat.h's kstat_named_t for boottime_solaris. The
+    class is only created once.
+    """
+    global __kstat_named_t
+    if __kstat_named_t is not None:
+        return __kstat_named_t
+
+    # Constant
+    KSTAT_STRLEN = 31   # According to every kstat.h I could find.
+
+    # Data structures
+    class anon_union(ctypes.Union):
+        # The ``value'' union in kstat_named_t actually has a bunch more
+        # members, but we're only using it for boot_time, so we only need
+        # the padding and the one we're actually using.
+        _fields_ = [('c', ctypes.c_char * 16),
+                    ('time', ctypes.c_int)]
+
+    class kstat_named_t(ctypes.Structure):
+        _fields_ = [('name', ctypes.c_char * KSTAT_STRLEN),
+                    ('data_type', ctypes.c_char),
+                    ('value', anon_union)]
+
+    __kstat_named_t = kstat_named_t
+    return kstat_named_t
+
+def uptime_linux():
+    """Returns uptime in seconds from Linux's sysinfo, or None."""
+    # Debian and derivatives do the wrong thing because /usr/lib/libc.so is a
+    # GNU ld script rather than an ELF object. To get around this, we have to
+    # be more specific.
+    # We don't want to use ctypes.util.find_library because that creates a
+    # new process on Linux. We also don't want to try too hard because at
+    # this point we're already pretty sure this isn't Linux.
+    sysinfo = _cfunc(_cdll('libc.so', 'libc.so.6'), 'sysinfo')
+    if sysinfo is None:
+        # Not Linux.
+        return None
+
+    buf = ctypes.create_string_buffer(128) # 64 suffices on 32-bit, whatever.
+    if sysinfo(buf) < 0:
+        return None
+
+    up = struct.unpack_from('@l', buf.raw)[0]
+    if up < 0:
+        up = None
+    return up
+
+def sysinfo_linux():
+    """
+    Returns uptime in seconds and the three load averages, as a tuple of an
+    int and a tuple of floats, from one call to Linux's sysinfo, or None.
+    """
+    sysinfo = _cfunc(_cdll('libc.so', 'libc.so.6'), 'sysinfo')
+    if sysinfo is None:
+        return None
+
+    buf = ctypes.create_string_buffer(128)
+    if sysinfo(buf) < 0:
+        return None
+
+    # long uptime; unsigned long loads[3], fixed-point with 16 bits after
+    # the point (SI_LOAD_SHIFT).
+    fields = struct.unpack_from('@l3L', buf.raw)
+    if fields[0] < 0:
+        return None
+    return fields[0], tuple(l / 65536. for l in fields[1:])
+
+def uptime_beos():
+    """Returns uptime in seconds or None, on BeOS/Haiku."""
+    if ctypes is None:
+        return None
+
+    system_time = _cfunc(_cdll('libroot.so'), 'system_time', ctypes.c_int64)
+    if system_time is None:
+        return None
+
+    return system_time() / 1000000.
+
+def boottime_bsd():
+    """Returns boot time in seconds since the epoch or None, on BSD."""
+    # libc.dylib is OS X; can't use ctypes.util.find_library because that
+    # creates a new process on Linux, which is undesirable.
+    sysctlbyname = _cfunc(_cdll('libc.so', 'libc.dylib'), 'sysctlbyname')
+    if sysctlbyname is None:
+        # Not BSD.
+        return None
+
+    # Without a prototype, ctypes passes a Python 3 str as a wchar_t *.
+    name = 'kern.boottime'.encode('ascii')
+
+    # Determine how much space we need for the response.
+    sz = ctypes.c_size_t(0)
+    sysctlbyname(name, None, ctypes.byref(sz), None, 0)
+    if sz.value != struct.calcsize('@LL'):
+        # Unexpected, let's give up.
+        return None
+
+    # For real now.
+    buf = ctypes.create_string_buffer(sz.value)
+    sysctlbyname(name, buf, ctypes.byref(sz), None, 0)
+    sec, usec = struct.unpack('@LL', buf.raw)
+
+    # OS X disagrees what that second value is.
+    if usec > 1000000:
+        usec = 0.
+
+    return sec + usec / 1000000.
+
+def boottime_solaris():
+    """Returns boot time in seconds since the epoch or None, on Solaris."""
+    if ctypes is None:
+        return None
+
+    kstat = _cdll('libkstat.so')
+    if kstat is None:
+        return None
+
+    # kstat doesn't have uptime, but it does have boot time.
+    # Unfortunately, getting at it isn't perfectly straightforward.
+    # First, let's pretend to be kstat.h (once).
+    kstat_open = _cfunc(kstat, 'kstat_open', ctypes.c_void_p)
+    kstat_lookup = _cfunc(kstat, 'kstat_lookup', ctypes.c_void_p,
+                          [ctypes.c_void_p,
+                           ctypes.c_char_p,
+                           ctypes.c_int,
+                           ctypes.c_char_p])
+    kstat_read = _cfunc(kstat, 'kstat_read', ctypes.c_int,
+                        [ctypes.c_void_p,
+                         ctypes.c_void_p,
+                         ctypes.c_void_p])
+    kstat_data_lookup = _cfunc(kstat, 'kstat_data_lookup',
+                               ctypes.POINTER(_kstat_named_t()),
+                               [ctypes.c_void_p,
+                                ctypes.c_char_p])
+    kstat_close = _cfunc(kstat, 'kstat_close')
+
+    # Now, let's do something useful.
+
+    # Initialise kstat control structure.
+    kc = kstat_open()
+    if not kc:
+        return None
+
+    # We're looking for unix:0:system_misc:boot_time.
+    bt = None
+    ksp = kstat_lookup(kc, 'unix'.encode('ascii'), 0,
+                       'system_misc'.encode('ascii'))
+    if ksp and kstat_read(kc, ksp, None) != -1:
+        data = kstat_data_lookup(ksp, 'boot_time'.encode('ascii'))
+        if data:
+            bt = data.contents.value.time
+
+    # Clean-up.
+    kstat_close(kc)
+
+    return bt
+
+def uptime_windows():
+    """
+    Returns uptime in seconds or None, on Windows. Warning: may return
+    incorrect answers after 49.7 days on versions older than Vista.
+    """
+    if ctypes is None:
+        return None
+
+    if hasattr(ctypes, 'windll') and hasattr(ctypes.windll, 'kernel32'):
+        lib = ctypes.windll.kernel32
+    else:
+        # Windows CE uses the cdecl calling convention.
+        lib = _cdll('coredll.lib')
+
+    GetTickCount64 = _cfunc(lib, 'GetTickCount64', ctypes.c_uint64)
+    if GetTickCount64 is not None:
+        # Vista/Server 2008 or later.
+        return GetTickCount64() / 1000.
+    GetTickCount = _cfunc(lib, 'GetTickCount', ctypes.c_uint32)
+    if GetTickCount is not None:
+        # WinCE and Win2k or later; gives wrong answers after 49.7 days.
+        return GetTickCount() / 1000.
+    return None
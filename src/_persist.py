@@ -0,0 +1,75 @@
+"""
+The cache file behind uptime.persist(), which lets short-lived processes on
+the same boot skip probing for a backend and the boot time.
+
+The file is one line: a format marker, the boot id it's valid for, the name
+of the backend, and the boot time in seconds since the epoch (or - if it
+isn't known). It's always replaced as a whole, never written in place, so
+readers see either the old line or the new one.
+"""
+
+import os
+
+MAGIC = 'uptime-cache-1'
+
+# Changes on every boot; see random(4).
+BOOT_ID = '/proc/sys/kernel/random/boot_id'
+
+def boot_id():
+    """Returns something that's different after every reboot, or None."""
+    try:
+        f = open(BOOT_ID, 'r')
+        try:
+            key = f.read().strip()
+        finally:
+            f.close()
+    except (IOError, OSError):
+        return None
+    # It goes in a space-separated line.
+    if not key or len(key.split()) != 1:
+        return None
+    return key
+
+def default_path():
+    """$XDG_RUNTIME_DIR/uptime.cache, or /run/uptime.cache."""
+    return os.path.join(os.environ.get('XDG_RUNTIME_DIR') or '/run',
+                        'uptime.cache')
+
+def writable(path):
+    """
+    Returns whether path can be replaced: dump() writes a new file next to it
+    and renames it over the old one, so it's the directory that matters.
+    """
+    return os.access(os.path.dirname(path) or os.curdir, os.W_OK | os.X_OK)
+
+def load(path, key, backends):
+    """
+    Returns the (backend, boot time) tuple cached in path, or None if there
+    isn't one, or it's not for this boot, or it names a backend that isn't in
+    backends. The boot time may be None.
+    """
+    try:
+        f = open(path, 'r')
+        try:
+            fields = f.read(256).split()
+        finally:
+            f.close()
+    except (IOError, OSError):
+        return None
+
+    if len(fields) != 4 or fields[0] != MAGIC or fields[1] != key or \
+       fields[2] not in backends:
+        return None
+    if fields[3] == '-':
+        return fields[2], None
+    try:
+        return fields[2], float(fields[3])
+    except ValueError:
+        return None
+
+def dump(path, key, backend, bt):
+    """Caches backend and boot time bt (which may be None) in path."""
+    from . import _replace_file
+    line = '%s %s %s %s\n' % (MAGIC, key, backend,
+                              '-' if bt is None else repr(float(bt)))
+    _replace_file(path, line.encode('ascii'))
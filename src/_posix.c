@@ -1,4 +1,7 @@
 #include <Python.h>
+#include <errno.h>
+#include <pthread.h>
+#include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
 #include <utmpx.h>
@@ -6,6 +9,20 @@
 #include <sys/sysctl.h>
 #endif
 #include <sys/time.h>
+#include <time.h>
+#ifdef __linux__
+#include <limits.h>
+#include <paths.h>
+#include <sys/sysinfo.h>
+#ifndef SI_LOAD_SHIFT
+#define SI_LOAD_SHIFT 16
+#endif
+#include <sys/timerfd.h>
+#include <unistd.h>
+#ifndef TFD_TIMER_CANCEL_ON_SET
+#define TFD_TIMER_CANCEL_ON_SET (1 << 1)
+#endif
+#endif
 
 
 /*
@@ -16,23 +33,27 @@ members. In practice, all of these things vary, and there's no way for us to
 find any of them at runtime from Python.
 */
 
+/* Returns the time since bt in seconds, or -1 if that can't be worked out
+   (or if bt seems to be in the future). */
 double _calc_uptime(struct timeval bt) {
     struct timeval tv;
+    long long usec;
+
     /* Get current time. */
     if (gettimeofday(&tv, NULL) != 0) {
         return -1;
     }
     
-    /* Subtract boot time from current time. */
-    if (tv.tv_usec < bt.tv_usec) {
-        tv.tv_sec--;
-        tv.tv_usec = 1000000 - bt.tv_usec + tv.tv_usec;
-    } else {
-        tv.tv_usec -= bt.tv_usec;
-    }
-    tv.tv_sec -= bt.tv_sec;
-    
-    return (unsigned)tv.tv_sec + (unsigned)tv.tv_usec / 1000000.0;
+    /* Subtract boot time from current time. Done in whole microseconds, so
+       nothing gets truncated, and signed, so nothing wraps around if the
+       clock has been set back to before boot. */
+    usec = (long long)(tv.tv_sec - bt.tv_sec) * 1000000 +
+           (tv.tv_usec - bt.tv_usec);
+    if (usec < 0) {
+        return -1;
+    }
+
+    return usec / 1000000.0;
 }
 
 #ifdef __APPLE__
@@ -41,46 +62,498 @@ _uptime_osx(PyObject *self, PyObject *args)
 {
     struct timeval bt;
     size_t len = sizeof(bt);
+    double up;
     
     /* Unused arguments. */
     (void)self;
     (void)args;
     
     /* Get boot time if it's there. */
-    if (sysctlbyname("kern.boottime", &bt, &len, NULL, 0) != 0) {
+    if (sysctlbyname("kern.boottime", &bt, &len, NULL, 0) != 0 ||
+        (up = _calc_uptime(bt)) < 0) {
         Py_RETURN_NONE;
     }
     
-    return Py_BuildValue("d", _calc_uptime(bt));
+    return Py_BuildValue("d", up);
 }
 #else
 // Other systems might not use sysctl
 static PyObject*
 _uptime_osx(PyObject *self, PyObject *args) {
-    Py_RETURN_NONE
+    Py_RETURN_NONE;
 }
 #endif
 
 
+/* Reads whichever clock counts the time since boot into ts. Returns 0, or
+   -1 if there isn't one. */
+static int
+_boot_clock(struct timespec *ts)
+{
+    (void)ts;
+
+#ifdef CLOCK_BOOTTIME
+    /* Linux 2.6.39+, OpenBSD, FreeBSD 12+. Includes time spent suspended. */
+    if (clock_gettime(CLOCK_BOOTTIME, ts) == 0) {
+        return 0;
+    }
+#endif
+#ifdef CLOCK_UPTIME
+    /* FreeBSD, NetBSD, DragonFly. */
+    if (clock_gettime(CLOCK_UPTIME, ts) == 0) {
+        return 0;
+    }
+#endif
+#ifdef __linux__
+    /* Older kernels don't have CLOCK_BOOTTIME. CLOCK_MONOTONIC counts from
+       boot as well, it just stops while the system is suspended. Elsewhere
+       it can start counting from anywhere, so we don't trust it. */
+    if (clock_gettime(CLOCK_MONOTONIC, ts) == 0) {
+        return 0;
+    }
+#endif
+
+    return -1;
+}
+
+static PyObject*
+_uptime_clock(PyObject *self, PyObject *args)
+{
+    struct timespec ts;
+
+    /* Unused arguments. */
+    (void)self;
+    (void)args;
+
+    if (_boot_clock(&ts) != 0) {
+        Py_RETURN_NONE;
+    }
+
+    return Py_BuildValue("d", ts.tv_sec + ts.tv_nsec / 1000000000.0);
+}
+
+static PyObject*
+_uptime_clock_ns(PyObject *self, PyObject *args)
+{
+    struct timespec ts;
+
+    /* Unused arguments. */
+    (void)self;
+    (void)args;
+
+    if (_boot_clock(&ts) != 0) {
+        Py_RETURN_NONE;
+    }
+
+    return PyLong_FromLongLong((long long)ts.tv_sec * 1000000000 +
+                               ts.tv_nsec);
+}
+
+
+static PyObject*
+_uptime_sysinfo(PyObject *self, PyObject *args)
+{
+#ifdef __linux__
+    struct sysinfo info;
+
+    /* Unused arguments. */
+    (void)self;
+    (void)args;
+
+    if (sysinfo(&info) != 0 || info.uptime < 0) {
+        Py_RETURN_NONE;
+    }
+
+    return Py_BuildValue("l", info.uptime);
+#else
+    /* Unused arguments. */
+    (void)self;
+    (void)args;
+
+    Py_RETURN_NONE;
+#endif
+}
+
+
+static PyObject*
+_sysinfo(PyObject *self, PyObject *args)
+{
+#ifdef __linux__
+    struct sysinfo info;
+    double scale = 1 << SI_LOAD_SHIFT;
+
+    /* Unused arguments. */
+    (void)self;
+    (void)args;
+
+    if (sysinfo(&info) != 0 || info.uptime < 0) {
+        Py_RETURN_NONE;
+    }
+
+    return Py_BuildValue("l(ddd)", info.uptime, info.loads[0] / scale,
+                         info.loads[1] / scale, info.loads[2] / scale);
+#else
+    /* Unused arguments. */
+    (void)self;
+    (void)args;
+
+    Py_RETURN_NONE;
+#endif
+}
+
+
+static PyObject*
+_clock_watch_fd(PyObject *self, PyObject *args)
+{
+#ifdef __linux__
+    struct itimerspec its;
+    int fd;
+
+    /* Unused arguments. */
+    (void)self;
+    (void)args;
+
+    /* A timer on the wall clock that won't go off in our lifetimes, but that
+       the kernel cancels (making the file descriptor readable, and reads from
+       it fail with ECANCELED) whenever the wall clock is set, or jumps
+       forward on resume. Linux 3.0+. */
+    if ((fd = timerfd_create(CLOCK_REALTIME, TFD_CLOEXEC | TFD_NONBLOCK)) < 0) {
+        Py_RETURN_NONE;
+    }
+    memset(&its, 0, sizeof(its));
+    its.it_value.tv_sec = LONG_MAX;
+    if (timerfd_settime(fd, TFD_TIMER_ABSTIME | TFD_TIMER_CANCEL_ON_SET,
+                        &its, NULL) != 0) {
+        close(fd);
+        Py_RETURN_NONE;
+    }
+
+    return PyLong_FromLong(fd);
+#else
+    /* Unused arguments. */
+    (void)self;
+    (void)args;
+
+    Py_RETURN_NONE;
+#endif
+}
+
+
+/*
+utmpx has a single, hidden position in a single database for the whole
+process, so everything here that uses it takes this lock first. It's a plain
+pthread mutex rather than anything of Python's because it has to work across
+interpreters and without the GIL, and it's never held while waiting for the
+GIL, so it can't deadlock with it.
+
+utmpx_owner is the boot_history() iterator the database is positioned for,
+if any. If anything else has used utmpx since, the iterator has to find its
+place again.
+*/
+static pthread_mutex_t utmpx_lock = PTHREAD_MUTEX_INITIALIZER;
+static void *utmpx_owner = NULL;
+
 static PyObject*
 _uptime_posix(PyObject *self, PyObject *args)
 {
     struct utmpx id = {.ut_type = BOOT_TIME}, *res;
     struct timeval bt;
+    int found = 0;
+    double up;
 
     /* Unused arguments. */
     (void)self;
     (void)args;
 
-    /* Get boot time if it's there. */
-    if ((res = getutxid(&id)) == NULL) {
-        endutxent();
-        Py_RETURN_NONE;
+    /* Get boot time if it's there. This reads a file, so other threads can
+       get on with things in the meantime. */
+    Py_BEGIN_ALLOW_THREADS
+    pthread_mutex_lock(&utmpx_lock);
+    setutxent();
+    if ((res = getutxid(&id)) != NULL) {
+        /* Not memcpy: ut_tv isn't necessarily a struct timeval. glibc uses
+           32-bit members even on 64-bit systems, so that utmpx files stay
+           the same. */
+        bt.tv_sec = res->ut_tv.tv_sec;
+        bt.tv_usec = res->ut_tv.tv_usec;
+        found = 1;
     }
-    memcpy(&bt, &(res->ut_tv), sizeof(struct timeval));
     endutxent();
+    utmpx_owner = NULL;
+    pthread_mutex_unlock(&utmpx_lock);
+    Py_END_ALLOW_THREADS
+
+    if (!found || (up = _calc_uptime(bt)) < 0) {
+        Py_RETURN_NONE;
+    }
+
+    return Py_BuildValue("d", up);
+}
+
+
+/*
+boot_history() walks wtmp (or whatever the local equivalent is) a record at a
+time. These files can get very large on long-lived systems, so records are
+read in batches with the GIL released, and nothing is kept around once it's
+been yielded.
+
+On Linux, wtmp is simply an array of struct utmpx (glibc's struct utmp and
+struct utmpx are the same thing), so we read it ourselves. That way every
+iterator has its own file and they can't trip each other up, and any file
+can be read, not just the one the C library thinks of. Elsewhere, we have to
+go through getutxent() and share its position with everyone else (see
+utmpx_lock).
+*/
+
+#define HISTORY_BATCH 256
+
+#ifdef __linux__
+#define HISTORY_FILE_IO
+#ifndef _PATH_WTMP
+#define _PATH_WTMP "/var/log/wtmp"
+#endif
+#endif
+
+typedef struct {
+    PyObject_HEAD
+#ifdef HISTORY_FILE_IO
+    FILE *file;
+#else
+    char *path;         /* For setutxdb(), if there is one. */
+    size_t consumed;    /* Records read from utmpx so far. */
+#endif
+    pthread_mutex_t busy;   /* Held while some thread is reading. */
+    struct utmpx records[HISTORY_BATCH];
+    size_t count;   /* Records in the buffer. */
+    size_t pos;     /* Next record in the buffer to look at. */
+    int done;       /* Nothing more to read. */
+} HistoryObject;
+
+#ifndef HISTORY_FILE_IO
+/* Points utmpx at the start of the history. utmpx_lock must be held. */
+static int
+history_rewind(HistoryObject *self)
+{
+#ifdef UTXDB_LOG
+    /* FreeBSD keeps the history in its own database. */
+    if (setutxdb(UTXDB_LOG, self->path) != 0) {
+        return -1;
+    }
+#else
+    setutxent();
+#endif
+    utmpx_owner = self;
+    return 0;
+}
+#endif
 
-    return Py_BuildValue("d", _calc_uptime(bt));
+static void
+history_close(HistoryObject *self)
+{
+#ifdef HISTORY_FILE_IO
+    if (self->file != NULL) {
+        fclose(self->file);
+        self->file = NULL;
+    }
+#else
+    pthread_mutex_lock(&utmpx_lock);
+    if (utmpx_owner == self) {
+        endutxent();
+        utmpx_owner = NULL;
+    }
+    pthread_mutex_unlock(&utmpx_lock);
+#endif
+    self->done = 1;
+}
+
+static void
+history_dealloc(HistoryObject *self)
+{
+    PyTypeObject *type = Py_TYPE(self);
+
+    history_close(self);
+#ifndef HISTORY_FILE_IO
+    free(self->path);
+#endif
+    pthread_mutex_destroy(&self->busy);
+    type->tp_free((PyObject *)self);
+#ifdef Py_TPFLAGS_HEAPTYPE
+    /* Instances of heap types own a reference to their type. */
+    if (type->tp_flags & Py_TPFLAGS_HEAPTYPE) {
+        Py_DECREF(type);
+    }
+#endif
+}
+
+/* Reads the next batch of records into the buffer, and returns how many
+   there were, or -1 (with errno set) on error. Called without the GIL. */
+static long
+history_fill(HistoryObject *self)
+{
+#ifdef HISTORY_FILE_IO
+    size_t n = fread(self->records, sizeof(struct utmpx), HISTORY_BATCH,
+                     self->file);
+    if (n == 0 && ferror(self->file)) {
+        return -1;
+    }
+    return (long)n;
+#else
+    struct utmpx *res;
+    size_t n = 0, skip;
+
+    pthread_mutex_lock(&utmpx_lock);
+    if (utmpx_owner != self) {
+        /* Someone else has used utmpx in the meantime. */
+        if (history_rewind(self) != 0) {
+            pthread_mutex_unlock(&utmpx_lock);
+            return -1;
+        }
+        for (skip = 0; skip < self->consumed && getutxent() != NULL; skip++)
+            ;
+    }
+    while (n < HISTORY_BATCH && (res = getutxent()) != NULL) {
+        memcpy(&self->records[n++], res, sizeof(struct utmpx));
+    }
+    self->consumed += n;
+    pthread_mutex_unlock(&utmpx_lock);
+    return (long)n;
+#endif
+}
+
+/* Returns the record as a tuple if it's one we care about, or NULL (without
+   an exception set) if it isn't. */
+static PyObject*
+history_record(struct utmpx *ut)
+{
+    double when = ut->ut_tv.tv_sec + ut->ut_tv.tv_usec / 1000000.0;
+#ifdef RUN_LVL
+    int level;
+#endif
+
+    switch (ut->ut_type) {
+    case BOOT_TIME:
+        return Py_BuildValue("(sdO)", "boot", when, Py_None);
+#ifdef SHUTDOWN_TIME
+    case SHUTDOWN_TIME:
+        return Py_BuildValue("(sdO)", "shutdown", when, Py_None);
+#endif
+#ifdef RUN_LVL
+    case RUN_LVL:
+        /* SysV init keeps the new run level in the low byte of ut_pid, and
+           records a shutdown as a change to run level 0 by "shutdown". */
+        if (strncmp(ut->ut_user, "shutdown", sizeof(ut->ut_user)) == 0) {
+            return Py_BuildValue("(sdO)", "shutdown", when, Py_None);
+        }
+        level = ut->ut_pid & 0xff;
+        if (level > ' ' && level < 0x7f) {
+#if PY_MAJOR_VERSION >= 3
+            return Py_BuildValue("(sdC)", "runlevel", when, level);
+#else
+            return Py_BuildValue("(sdc)", "runlevel", when, (char)level);
+#endif
+        }
+        return Py_BuildValue("(sdO)", "runlevel", when, Py_None);
+#endif
+    default:
+        return NULL;
+    }
+}
+
+static PyObject*
+history_next(HistoryObject *self)
+{
+    PyObject *res = NULL;
+    long n;
+
+    /* Rather than wait for another thread to finish reading, complain, the
+       way generators do. */
+    if (pthread_mutex_trylock(&self->busy) != 0) {
+        PyErr_SetString(PyExc_ValueError, "boot_history() already executing");
+        return NULL;
+    }
+
+    while (!self->done) {
+        while (self->pos < self->count) {
+            res = history_record(&self->records[self->pos++]);
+            if (res != NULL || PyErr_Occurred()) {
+                goto done;
+            }
+        }
+
+        Py_BEGIN_ALLOW_THREADS
+        n = history_fill(self);
+        Py_END_ALLOW_THREADS
+        self->pos = 0;
+        self->count = n > 0 ? (size_t)n : 0;
+
+        if (n < 0) {
+            PyErr_SetFromErrno(PyExc_OSError);
+        }
+        if (n <= 0) {
+            history_close(self);
+        }
+    }
+
+done:
+    pthread_mutex_unlock(&self->busy);
+    return res;
+}
+
+static PyObject*
+history_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
+{
+    static char *kwlist[] = {"path", NULL};
+    const char *path = NULL;
+    HistoryObject *self;
+#ifndef HISTORY_FILE_IO
+    int failed;
+#endif
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "|z:_boot_history", kwlist,
+                                     &path)) {
+        return NULL;
+    }
+
+#if !defined(HISTORY_FILE_IO) && !defined(UTXDB_LOG)
+    if (path != NULL) {
+        errno = ENOSYS;
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
+#endif
+
+    if ((self = (HistoryObject *)type->tp_alloc(type, 0)) == NULL) {
+        return NULL;
+    }
+    pthread_mutex_init(&self->busy, NULL);
+
+#ifdef HISTORY_FILE_IO
+    Py_BEGIN_ALLOW_THREADS
+    self->file = fopen(path != NULL ? path : _PATH_WTMP, "rb");
+    Py_END_ALLOW_THREADS
+    if (self->file == NULL) {
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError,
+                                       path != NULL ? path : _PATH_WTMP);
+        Py_DECREF(self);
+        return NULL;
+    }
+#else
+    if (path != NULL && (self->path = strdup(path)) == NULL) {
+        Py_DECREF(self);
+        return PyErr_NoMemory();
+    }
+    Py_BEGIN_ALLOW_THREADS
+    pthread_mutex_lock(&utmpx_lock);
+    failed = history_rewind(self) != 0;
+    pthread_mutex_unlock(&utmpx_lock);
+    Py_END_ALLOW_THREADS
+    if (failed) {
+        PyErr_SetFromErrno(PyExc_OSError);
+        Py_DECREF(self);
+        return NULL;
+    }
+#endif
+
+    return (PyObject *)self;
 }
 
 static PyMethodDef _uptime_methods[] = {
@@ -88,9 +561,165 @@ static PyMethodDef _uptime_methods[] = {
      "Fallback uptime for POSIX."},
     {"_uptime_osx", _uptime_osx, METH_NOARGS,
         "Uptime for OS X"},
+    {"_uptime_clock", _uptime_clock, METH_NOARGS,
+     "Uptime from clock_gettime."},
+    {"_uptime_clock_ns", _uptime_clock_ns, METH_NOARGS,
+     "Uptime from clock_gettime, in nanoseconds."},
+    {"_uptime_sysinfo", _uptime_sysinfo, METH_NOARGS,
+     "Uptime from sysinfo, on Linux."},
+    {"_sysinfo", _sysinfo, METH_NOARGS,
+     "Uptime and load averages from one call to sysinfo, on Linux."},
+    {"_clock_watch_fd", _clock_watch_fd, METH_NOARGS,
+     "A timerfd that becomes readable when the wall clock is set."},
     {NULL, NULL, 0, NULL}
 };
 
+
+#if PY_VERSION_HEX >= 0x03050000
+
+/*
+Multi-phase initialisation (PEP 489), so each interpreter gets its own
+module and its own _boot_history type. Nothing in here relies on the GIL:
+the functions don't share any Python state, utmpx has its own lock, and each
+iterator has its own.
+*/
+
+typedef struct {
+    PyObject *history_type;
+} module_state;
+
+static PyType_Slot history_slots[] = {
+    {Py_tp_dealloc, (void *)history_dealloc},
+    {Py_tp_iter, (void *)PyObject_SelfIter},
+    {Py_tp_iternext, (void *)history_next},
+    {Py_tp_new, (void *)history_new},
+    {Py_tp_doc, (void *)"Boot, shutdown and run level records from wtmp."},
+    {0, NULL}
+};
+
+static PyType_Spec history_spec = {
+    "uptime._posix._boot_history",
+    sizeof(HistoryObject),
+    0,
+    Py_TPFLAGS_DEFAULT,
+    history_slots
+};
+
+static int
+_posix_exec(PyObject *m)
+{
+    module_state *state = (module_state *)PyModule_GetState(m);
+
+#if PY_VERSION_HEX >= 0x03090000
+    state->history_type = PyType_FromModuleAndSpec(m, &history_spec, NULL);
+#else
+    state->history_type = PyType_FromSpec(&history_spec);
+#endif
+    if (state->history_type == NULL) {
+        return -1;
+    }
+    Py_INCREF(state->history_type);
+    if (PyModule_AddObject(m, "_boot_history", state->history_type) < 0) {
+        Py_DECREF(state->history_type);
+        return -1;
+    }
+    return 0;
+}
+
+static int
+_posix_traverse(PyObject *m, visitproc visit, void *arg)
+{
+    module_state *state = (module_state *)PyModule_GetState(m);
+    Py_VISIT(state->history_type);
+    return 0;
+}
+
+static int
+_posix_clear(PyObject *m)
+{
+    module_state *state = (module_state *)PyModule_GetState(m);
+    Py_CLEAR(state->history_type);
+    return 0;
+}
+
+static void
+_posix_free(void *m)
+{
+    _posix_clear((PyObject *)m);
+}
+
+static PyModuleDef_Slot _posix_slots[] = {
+    {Py_mod_exec, (void *)_posix_exec},
+#ifdef Py_mod_multiple_interpreters
+    {Py_mod_multiple_interpreters, Py_MOD_PER_INTERPRETER_GIL_SUPPORTED},
+#endif
+#ifdef Py_mod_gil
+    {Py_mod_gil, Py_MOD_GIL_NOT_USED},
+#endif
+    {0, NULL}
+};
+
+static struct PyModuleDef moduledef = {
+    PyModuleDef_HEAD_INIT,
+    "uptime._posix",
+    "Fallback uptime for POSIX.",
+    sizeof(module_state),
+    _uptime_methods,
+    _posix_slots,
+    _posix_traverse,
+    _posix_clear,
+    _posix_free
+};
+
+PyMODINIT_FUNC
+PyInit__posix(void)
+{
+    return PyModuleDef_Init(&moduledef);
+}
+
+#else
+
+static PyTypeObject HistoryType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "uptime._posix._boot_history",      /* tp_name */
+    sizeof(HistoryObject),              /* tp_basicsize */
+    0,                                  /* tp_itemsize */
+    (destructor)history_dealloc,        /* tp_dealloc */
+    0,                                  /* tp_print */
+    0,                                  /* tp_getattr */
+    0,                                  /* tp_setattr */
+    0,                                  /* tp_compare */
+    0,                                  /* tp_repr */
+    0,                                  /* tp_as_number */
+    0,                                  /* tp_as_sequence */
+    0,                                  /* tp_as_mapping */
+    0,                                  /* tp_hash */
+    0,                                  /* tp_call */
+    0,                                  /* tp_str */
+    0,                                  /* tp_getattro */
+    0,                                  /* tp_setattro */
+    0,                                  /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                 /* tp_flags */
+    "Boot, shutdown and run level records from wtmp.", /* tp_doc */
+    0,                                  /* tp_traverse */
+    0,                                  /* tp_clear */
+    0,                                  /* tp_richcompare */
+    0,                                  /* tp_weaklistoffset */
+    PyObject_SelfIter,                  /* tp_iter */
+    (iternextfunc)history_next,         /* tp_iternext */
+    0,                                  /* tp_methods */
+    0,                                  /* tp_members */
+    0,                                  /* tp_getset */
+    0,                                  /* tp_base */
+    0,                                  /* tp_dict */
+    0,                                  /* tp_descr_get */
+    0,                                  /* tp_descr_set */
+    0,                                  /* tp_dictoffset */
+    0,                                  /* tp_init */
+    0,                                  /* tp_alloc */
+    history_new,                        /* tp_new */
+};
+
 #if PY_MAJOR_VERSION >= 3
 
 static struct PyModuleDef moduledef = {
@@ -108,7 +737,22 @@ static struct PyModuleDef moduledef = {
 PyMODINIT_FUNC
 PyInit__posix(void)
 {
-    return PyModule_Create(&moduledef);
+    PyObject *m;
+
+    if (PyType_Ready(&HistoryType) < 0) {
+        return NULL;
+    }
+    if ((m = PyModule_Create(&moduledef)) == NULL) {
+        return NULL;
+    }
+    Py_INCREF(&HistoryType);
+    if (PyModule_AddObject(m, "_boot_history",
+                           (PyObject *)&HistoryType) < 0) {
+        Py_DECREF(&HistoryType);
+        Py_DECREF(m);
+        return NULL;
+    }
+    return m;
 }
 
 #else
@@ -116,7 +760,18 @@ PyInit__posix(void)
 PyMODINIT_FUNC
 init_posix(void)
 {
-    Py_InitModule("_posix", _uptime_methods);
+    PyObject *m;
+
+    if (PyType_Ready(&HistoryType) < 0) {
+        return;
+    }
+    if ((m = Py_InitModule("_posix", _uptime_methods)) == NULL) {
+        return;
+    }
+    Py_INCREF(&HistoryType);
+    PyModule_AddObject(m, "_boot_history", (PyObject *)&HistoryType);
 }
 
 #endif
+
+#endif
@@ -0,0 +1,220 @@
+"""
+Backends that read procfs-style text files: Linux, MINIX and Plan 9.
+
+None of these need ctypes. The functions in here only read and parse;
+uptime's own helpers decide what to do with the answers.
+"""
+
+import os
+
+# Where procfs lives, unless we're told otherwise (e.g. because we're in a
+# container with the host's mounted somewhere else).
+PROCFS = '/proc'
+
+# How much to read at a time when looking for something in a larger file.
+_CHUNK = 4096
+
+__btime = {}
+__clock_ticks = None
+
+def uptime_linux(procfs=PROCFS):
+    """Returns the first field of /proc/uptime, or None."""
+    try:
+        f = open(os.path.join(procfs, 'uptime'), 'r')
+        up = float(f.readline().split()[0])
+        f.close()
+        return up
+    except (IOError, ValueError, IndexError):
+        return None
+
+def uptime_minix(procfs=PROCFS):
+    """Returns the contents of MINIX's /proc/uptime, or None."""
+    try:
+        f = open(os.path.join(procfs, 'uptime'), 'r')
+        up = float(f.read())
+        f.close()
+        return up
+    except (IOError, ValueError):
+        return None
+
+def uptime_plan9():
+    """Returns uptime in seconds as worked out from /dev/time, or None."""
+    # Apparently Plan 9 only has Python 2.2, which I'm not prepared to
+    # support. Maybe some Linuxes implement /dev/time, though, someone was
+    # talking about it somewhere.
+    try:
+        # The time file holds one 32-bit number representing the sec-
+        # onds since start of epoch and three 64-bit numbers, repre-
+        # senting nanoseconds since start of epoch, clock ticks, and
+        # clock frequency.
+        #  -- cons(3)
+        f = open('/dev/time', 'r')
+        s, ns, ct, cf = f.read().split()
+        f.close()
+        return float(ct) / float(cf)
+    except (IOError, ValueError):
+        return None
+
+def boottime_linux(procfs=PROCFS):
+    """
+    Returns the btime entry from /proc/stat, or None. Boot time doesn't
+    change without a reboot, so the file is only read until it's found once.
+    """
+    btime = __btime.get(procfs)
+    if btime is None:
+        btime = _read_btime(os.path.join(procfs, 'stat'))
+        if btime is not None:
+            __btime[procfs] = btime
+    return btime
+
+def forget_boottime():
+    """
+    Forgets the boot times boottime_linux() has read, because the wall clock
+    has been set since.
+    """
+    __btime.clear()
+
+def _read_btime(path):
+    """
+    Returns the btime entry from a /proc/stat-style file, or None. Reads the
+    file a chunk at a time, and stops as soon as it comes across btime rather
+    than wading through the (possibly very long) rest of it.
+    """
+    try:
+        f = open(path, 'r')
+    except IOError:
+        return None
+    try:
+        # The newline makes a btime on the first line look like the others.
+        buf = '\n'
+        while True:
+            chunk = f.read(_CHUNK)
+            buf += chunk
+            start = buf.find('\nbtime ')
+            if start < 0:
+                if not chunk:
+                    return None
+                # Hang on to just enough to match across chunks.
+                buf = buf[-6:]
+                continue
+            end = buf.find('\n', start + 1)
+            if end >= 0:
+                return int(buf[start + 7:end])
+            if not chunk:
+                return int(buf[start + 7:])
+    except (IOError, ValueError):
+        return None
+    finally:
+        f.close()
+
+def snapshot_linux(procfs=PROCFS):
+    """
+    Returns (uptime, idle, idle ratios, load averages, boot time) from one
+    read each of /proc/uptime, /proc/loadavg and /proc/stat, or None if
+    /proc/uptime can't be read. Anything else that can't be read is None.
+    """
+    try:
+        f = open(os.path.join(procfs, 'uptime'), 'r')
+        try:
+            fields = f.read().split()
+        finally:
+            f.close()
+        up, idle = float(fields[0]), float(fields[1])
+    except (IOError, ValueError, IndexError):
+        return None
+
+    try:
+        f = open(os.path.join(procfs, 'loadavg'), 'r')
+        try:
+            fields = f.read().split()
+        finally:
+            f.close()
+        loads = tuple(float(l) for l in fields[:3])
+        if len(loads) != 3:
+            loads = None
+    except (IOError, ValueError):
+        loads = None
+
+    ratios, btime = _read_stat(os.path.join(procfs, 'stat'))
+    if btime is not None:
+        __btime[procfs] = btime
+    else:
+        btime = __btime.get(procfs)
+
+    return up, idle, ratios, loads, btime
+
+def _read_stat(path):
+    """
+    Returns how much of its time each CPU has spent idle since boot, as a
+    tuple of ratios, and the btime entry from a /proc/stat-style file. Either
+    may be None.
+    """
+    try:
+        f = open(path, 'r')
+        try:
+            lines = f.read().splitlines()
+        finally:
+            f.close()
+    except IOError:
+        return None, None
+
+    ratios, btime = [], None
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0].startswith('cpu') and fields[0] != 'cpu':
+            # user nice system idle iowait irq softirq steal, in clock ticks.
+            # Guest time is already counted as user time.
+            try:
+                ticks = [int(t) for t in fields[1:9]]
+            except ValueError:
+                continue
+            total = sum(ticks)
+            idle = sum(ticks[3:5])
+            ratios.append(float(idle) / total if total else 0.)
+        elif fields[0] == 'btime':
+            try:
+                btime = int(fields[1])
+            except (ValueError, IndexError):
+                pass
+            # Nothing of interest comes after it.
+            break
+    return tuple(ratios) or None, btime
+
+def clock_ticks():
+    """Returns the number of clock ticks per second, or None."""
+    global __clock_ticks
+    if __clock_ticks is None:
+        try:
+            __clock_ticks = os.sysconf('SC_CLK_TCK')
+        except (AttributeError, ValueError, OSError):
+            return None
+    return __clock_ticks
+
+def pids(procfs=PROCFS):
+    """Returns a list of the pids in /proc, or an empty list."""
+    try:
+        return [int(d) for d in os.listdir(procfs) if d.isdigit()]
+    except OSError:
+        return []
+
+def starttimes(pids, procfs=PROCFS):
+    """
+    Yields (pid, start time in clock ticks since boot) for each of the pids,
+    skipping the ones that have gone away (or never existed).
+    """
+    rparen = ')'.encode('ascii')
+    for pid in pids:
+        try:
+            f = open(os.path.join(procfs, str(pid), 'stat'), 'rb')
+            try:
+                data = f.read()
+            finally:
+                f.close()
+            # The second field is the command name in parentheses, and it
+            # can contain anything, including spaces and parentheses.
+            # starttime is the 20th field after it.
+            yield pid, int(data[data.rindex(rparen) + 2:].split()[19])
+        except (IOError, OSError, ValueError, IndexError):
+            continue
@@ -0,0 +1,104 @@
+"""
+The boot session index behind uptime.boot_index(): past boot times, sorted,
+so a timestamp's boot session and time since boot are a bisection away.
+"""
+
+import sys
+from array import array
+from bisect import bisect_right
+
+# What a saved index starts with. The boot times follow as little-endian
+# doubles.
+MAGIC = 'uptime-boot-index-1\n'.encode('ascii')
+
+# The boot record in wtmp is written some time after the kernel considers
+# itself booted, and /proc/stat's btime is rounded down, so a recorded boot
+# this close to (or after) the current boot time is the current boot.
+_SLACK = 5
+
+class BootIndex(object):
+    """
+    The known boot times, oldest first, as an array of seconds since the
+    epoch. Session n is the one that started at epochs[n].
+    """
+    __slots__ = ('epochs',)
+
+    def __init__(self, epochs):
+        self.epochs = array('d', sorted(epochs))
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def __repr__(self):
+        return '<BootIndex of %d boot sessions>' % len(self.epochs)
+
+    def lookup(self, timestamps):
+        """
+        Returns (session, seconds since boot) for a timestamp, or a pair of
+        lists of them for a sequence of timestamps (a pair of arrays, for a
+        NumPy array). Timestamps from before the first known boot are in
+        session -1, and have None (or NaN) for a time since boot.
+        """
+        epochs = self.epochs
+        try:
+            iter(timestamps)
+        except TypeError:
+            i = bisect_right(epochs, timestamps) - 1
+            if i < 0:
+                return -1, None
+            return i, timestamps - epochs[i]
+        if type(timestamps).__module__ == 'numpy':
+            return self._lookup_array(timestamps)
+
+        sessions = [bisect_right(epochs, t) - 1 for t in timestamps]
+        since = [None if i < 0 else t - epochs[i]
+                 for i, t in zip(sessions, timestamps)]
+        return sessions, since
+
+    def _lookup_array(self, timestamps):
+        """lookup() for NumPy arrays, using searchsorted."""
+        import numpy
+        epochs = numpy.frombuffer(self.epochs, dtype=float)
+        timestamps = numpy.asarray(timestamps, dtype=float)
+        sessions = numpy.searchsorted(epochs, timestamps, side='right') - 1
+        if not len(epochs):
+            return sessions, numpy.full(timestamps.shape, numpy.nan)
+        since = timestamps - epochs[numpy.maximum(sessions, 0)]
+        since[sessions < 0] = numpy.nan
+        return sessions, since
+
+    def save(self, path):
+        """
+        Writes the index to a file, atomically, for uptime.load_boot_index().
+        """
+        from . import _replace_file
+        epochs = array('d', self.epochs)
+        if sys.byteorder == 'big':
+            epochs.byteswap()
+        # tobytes() is tostring() before Python 3.2.
+        tobytes = getattr(epochs, 'tobytes', None) or epochs.tostring
+        _replace_file(path, MAGIC + tobytes())
+
+def loads(data):
+    """Returns the BootIndex BootIndex.save() wrote data for."""
+    if not data.startswith(MAGIC):
+        raise ValueError('not a boot index')
+    epochs = array('d')
+    frombytes = getattr(epochs, 'frombytes', None) or epochs.fromstring
+    frombytes(data[len(MAGIC):])
+    if sys.byteorder == 'big':
+        epochs.byteswap()
+    index = BootIndex(())
+    index.epochs = epochs
+    return index
+
+def build(boots, current):
+    """
+    Returns a BootIndex of the boot times in boots, and the current boot time
+    (which may be None).
+    """
+    boots = list(boots)
+    if current is not None:
+        boots = [bt for bt in boots if bt < current - _SLACK]
+        boots.append(current)
+    return BootIndex(set(boots))
@@ -0,0 +1,23 @@
+"""
+The result of uptime.snapshot(): the uptime, idle times, load averages and
+boot time, read together.
+"""
+
+class Snapshot(object):
+    """
+    Uptime and related figures, all read at (very nearly) the same moment.
+    Anything that couldn't be determined is None.
+    """
+    __slots__ = ('uptime', 'idle', 'idle_ratios', 'load', 'boottime')
+
+    def __init__(self, uptime, idle=None, idle_ratios=None, load=None,
+                 boottime=None):
+        self.uptime = uptime
+        self.idle = idle
+        self.idle_ratios = idle_ratios
+        self.load = load
+        self.boottime = boottime
+
+    def __repr__(self):
+        return '<Snapshot %s>' % ' '.join('%s=%r' % (name, getattr(self, name))
+                                          for name in self.__slots__)
@@ -0,0 +1,126 @@
+"""
+The thread behind uptime.watch(), which notices the wall clock being set and
+the system resuming from suspend.
+
+Linux cancels a timerfd armed with TFD_TIMER_CANCEL_ON_SET whenever the wall
+clock is set, and also when the system resumes from suspend (the wall clock
+jumps forward relative to CLOCK_MONOTONIC then as well). The thread sleeps
+in select() on one of those until that happens, so watching costs nothing
+in between. When it wakes up, how far CLOCK_BOOTTIME has moved relative to
+CLOCK_MONOTONIC says how long the system was suspended, and whatever the wall
+clock has moved on top of that is how far it was set.
+"""
+
+import os
+import select
+import sys
+import threading
+import time
+import traceback
+
+# Changes smaller than this (in seconds) are just the clocks being read a
+# moment apart.
+TOLERANCE = 1e-3
+
+def offsets(boot_clock):
+    """
+    Returns how far ahead of CLOCK_MONOTONIC the wall clock and boot_clock
+    (which reads CLOCK_BOOTTIME) are, in seconds.
+    """
+    mono = time.monotonic()
+    real = time.time()
+    boot = boot_clock()
+    mono = (mono + time.monotonic()) / 2
+    return real - mono, boot - mono
+
+class Watcher(object):
+    """
+    Waits for the wall clock to be set or the system to resume, and calls
+    changed(event, seconds) when it does: event is 'clock' (seconds is how
+    far it was set) or 'suspend' (seconds is how long it was suspended).
+    closed is True once it's stopped, or its thread has given up because
+    watch_fd() couldn't replace the timer.
+    """
+    def __init__(self, watch_fd, boot_clock, changed):
+        self.watch_fd = watch_fd
+        self.boot_clock = boot_clock
+        self.changed = changed
+        self.fd = None
+        self.last = None
+        self.thread = None
+        self.stop_r = self.stop_w = None
+        self.closed = True
+        self.lock = None
+
+    def start(self):
+        """Starts watching, and returns True, or False if it can't."""
+        self.fd = self.watch_fd()
+        if self.fd is None:
+            return False
+        self.last = offsets(self.boot_clock)
+        self.stop_r, self.stop_w = os.pipe()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """
+        Stops watching, and waits for the thread to finish, unless it's the
+        thread calling (from changed()), in which case it finishes as soon as
+        that returns.
+        """
+        self.lock.acquire()
+        try:
+            if not self.closed:
+                os.write(self.stop_w, '.'.encode('ascii'))
+        finally:
+            self.lock.release()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def run(self):
+        # The descriptors belong to this thread, and it closes them on its
+        # way out, however it gets there.
+        try:
+            while True:
+                ready = select.select([self.fd, self.stop_r], [], [])[0]
+                if self.stop_r in ready:
+                    return
+                # Once cancelled, the timer stays cancelled, so it's
+                # replaced before looking at the clocks: anything that
+                # happens after that wakes us up again.
+                fd = self.watch_fd()
+                if fd is None:
+                    return
+                old, self.fd = self.fd, fd
+                os.close(old)
+                self.check()
+        finally:
+            self.lock.acquire()
+            try:
+                self.closed = True
+                for fd in (self.fd, self.stop_r, self.stop_w):
+                    os.close(fd)
+            finally:
+                self.lock.release()
+
+    def check(self):
+        """Works out what happened since last time, and reports it."""
+        real, boot = offsets(self.boot_clock)
+        suspended = boot - self.last[1]
+        stepped = real - self.last[0] - suspended
+        self.last = real, boot
+
+        events = []
+        if suspended > TOLERANCE:
+            events.append(('suspend', suspended))
+        if abs(stepped) > TOLERANCE or not events:
+            events.append(('clock', stepped))
+        for event, seconds in events:
+            try:
+                self.changed(event, seconds)
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
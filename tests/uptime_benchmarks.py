@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks for uptime. Run from the top of the source tree:
+
+    python tests/uptime_benchmarks.py [--json FILE] [--max-import-us N]
+
+This measures how long it takes to import uptime, how long the first call to
+uptime(), boottime() and each of the helpers takes in a fresh interpreter,
+and how long later calls take, both normally and with ctypes broken the same
+way BrokenCtypesTest breaks it.
+
+With --json, the results are also written to FILE ('-' for standard output)
+so they can be compared across releases. With --max-import-us, exits with a
+non-zero status if importing uptime takes longer than N microseconds (best of
+several runs), so it can be used to catch import-time regressions.
+"""
+
+import compileall
+import json
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, '.')
+
+try:
+    from importlib import reload
+except ImportError:
+    try:
+        from imp import reload
+    except ImportError:
+        pass
+
+import src as uptime
+from src import _native
+
+
+timer = getattr(time, 'perf_counter', time.time)
+
+helpers = sorted(f for f in vars(uptime)
+                 if f.startswith('_uptime_') or f.startswith('_boottime_'))
+
+# Run in a fresh interpreter before the first call when ctypes should be
+# broken; see BrokenCtypesTest.
+BREAK_CTYPES = ('from src import _native; '
+                '_native.ctypes = None; del _native.struct; del uptime.os; ')
+
+
+def import_time(runs=15):
+    """
+    Imports uptime in a fresh interpreter under ``python -X importtime`` a
+    number of times, and returns the cumulative import times in microseconds
+    of the package itself, best first.
+    """
+    times = []
+    for i in range(runs):
+        err = subprocess.Popen(
+            [sys.executable, '-X', 'importtime', '-c',
+             'import sys; sys.path.insert(0, "."); import src'],
+            stderr=subprocess.PIPE).communicate()[1]
+        for line in err.decode().splitlines():
+            # import time: self [us] | cumulative | imported package
+            fields = [f.strip() for f in line.split(':', 1)[-1].split('|')]
+            if len(fields) == 3 and fields[2] == 'src':
+                times.append(int(fields[1]))
+    return sorted(times)
+
+def cold_call(func, broken=False, runs=5):
+    """
+    Calls uptime's func once in a fresh interpreter a number of times, and
+    returns how long that took in microseconds, best first.
+    """
+    code = ('import sys, time; sys.path.insert(0, "."); import src as uptime; '
+            'timer = getattr(time, "perf_counter", time.time); %s'
+            't = timer(); uptime.%s(); sys.stdout.write(str(timer() - t))' %
+            (BREAK_CTYPES if broken else '', func))
+    times = []
+    for i in range(runs):
+        out = subprocess.Popen([sys.executable, '-c', code],
+                               stdout=subprocess.PIPE).communicate()[0]
+        try:
+            times.append(float(out) * 1e6)
+        except ValueError:
+            pass
+    return sorted(times)
+
+def warm_call(func, min_time=.1):
+    """
+    Calls func once, then over and over again for at least min_time seconds,
+    and returns the average time per call in nanoseconds.
+    """
+    func()
+    n, elapsed = 1, 0.
+    while elapsed < min_time:
+        n *= 2
+        t = timer()
+        for i in range(n):
+            func()
+        elapsed = timer() - t
+    return elapsed / n * 1e9
+
+def run(broken=False):
+    """
+    Runs the cold and warm call benchmarks for uptime(), boottime() and all
+    of the helpers, and returns the results as a dict.
+    """
+    results = {'cold_us': {}, 'warm_ns': {}}
+    for func in ['uptime', 'boottime'] + helpers:
+        times = cold_call(func, broken)
+        if times:
+            results['cold_us'][func] = {'best': times[0],
+                                        'median': times[len(times) // 2]}
+
+    reload(_native)
+    reload(uptime)
+    if broken:
+        _native.ctypes = None
+        del _native.struct
+        del uptime.os
+    try:
+        for func in ['uptime', 'boottime'] + helpers:
+            try:
+                results['warm_ns'][func] = warm_call(getattr(uptime, func))
+            except Exception:
+                pass
+        results['backend'] = uptime.backend()
+    finally:
+        reload(_native)
+        reload(uptime)
+    return results
+
+def report(results):
+    """Writes a human-readable summary of the results to standard output."""
+    sys.stdout.write('Python %s on %s\n\n' % (results['python'],
+                                               results['platform']))
+    sys.stdout.write('import uptime: best %d us, median %d us\n' %
+                     (results['import_us']['best'],
+                      results['import_us']['median']))
+    for mode in ('normal', 'broken_ctypes'):
+        res = results[mode]
+        sys.stdout.write('\n%s (backend: %s)\n' % (mode.replace('_', ' '),
+                                                   res['backend']))
+        sys.stdout.write('%-20s %14s %14s\n' % ('', 'cold (us)', 'warm (ns)'))
+        for func in ['uptime', 'boottime'] + helpers:
+            cold = res['cold_us'].get(func)
+            warm = res['warm_ns'].get(func)
+            sys.stdout.write('%-20s %14s %14s\n' %
+                             (func,
+                              '%.1f' % cold['best'] if cold else '-',
+                              '%.1f' % warm if warm is not None else '-'))
+
+
+if __name__ == '__main__':
+    budget = None
+    if '--max-import-us' in sys.argv:
+        budget = int(sys.argv[sys.argv.index('--max-import-us') + 1])
+    out = None
+    if '--json' in sys.argv:
+        out = sys.argv[sys.argv.index('--json') + 1]
+
+    # Byte-compile first, so we're timing the import and not the compiler.
+    compileall.compile_dir('src', quiet=1)
+
+    times = import_time()
+    if not times:
+        sys.stderr.write('Could not measure import time (Python 3.7+ '
+                         'required).\n')
+        sys.exit(1)
+
+    results = {'python': sys.version.split()[0],
+               'platform': sys.platform,
+               'import_us': {'best': times[0],
+                             'median': times[len(times) // 2]},
+               'normal': run(),
+               'broken_ctypes': run(broken=True)}
+
+    if out == '-':
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        report(results)
+        if out is not None:
+            f = open(out, 'w')
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.close()
+
+    if budget is not None and times[0] > budget:
+        sys.stderr.write('Import time over budget (%d us).\n' % budget)
+        sys.exit(1)
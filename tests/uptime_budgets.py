@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+"""
+Side-effect budgets for uptime. Run from the top of the source tree:
+
+    python tests/uptime_budgets.py [--json FILE]
+
+Calls uptime(), boottime() and each of the helpers in a fresh interpreter
+with an audit hook (see sys.addaudithook; Python 3.8+) installed, once cold
+and then once more warm, and counts the events each call raises: files
+opened, processes started, libraries loaded through ctypes, and anything else
+the os module audits. Exits with a non-zero status if any call goes over its
+budget (see BUDGETS), so an extra file open or a process spawned by
+something like ctypes.util.find_library doesn't sneak into a hot path.
+
+Modules uptime imports lazily are imported before the hook goes in, since
+what importing costs is uptime_benchmarks.py's business.
+
+With --json, the events are also written to FILE ('-' for standard output).
+"""
+
+import json
+import subprocess
+import sys
+
+sys.path.insert(0, '.')
+
+import src as uptime
+
+
+helpers = sorted(f for f in vars(uptime)
+                 if f.startswith('_uptime_') or f.startswith('_boottime_'))
+
+# Events that start another process. They count as 'subprocess', even the
+# ones that start with 'os.'.
+SPAWN = ('subprocess.Popen', 'os.system', 'os.fork', 'os.forkpty',
+         'os.posix_spawn', 'os.spawn', 'os.exec', 'os.startfile', 'pty.spawn')
+
+# How many events of each kind a call may raise, as (platform prefix,
+# backend, function, phase, {kind: limit}). None matches anything. Every
+# matching line applies.
+BUDGETS = [
+    # Nothing ever starts a process.
+    (None, None, None, None, {'subprocess': 0}),
+    # Libraries are loaded once per process, if at all.
+    (None, None, None, 'warm', {'dlopen': 0}),
+    # Once a backend has been found, uptime() only does what it does.
+    (None, 'clock', 'uptime', 'warm', {'open': 0, 'os': 0}),
+    (None, 'linux', 'uptime', 'warm', {'open': 1, 'os': 0}),
+    (None, 'bsd', 'uptime', 'warm', {'open': 0, 'os': 0}),
+    (None, 'osx', 'uptime', 'warm', {'open': 0, 'os': 0}),
+    (None, 'solaris', 'uptime', 'warm', {'open': 0, 'os': 0}),
+    (None, 'windows', 'uptime', 'warm', {'open': 0, 'os': 0}),
+    # On Linux, probing needs nothing but a clock, and the boot time one
+    # look at /proc/stat, after which it's remembered.
+    ('linux', 'clock', 'uptime', 'cold', {'open': 0, 'dlopen': 0, 'os': 0}),
+    ('linux', 'clock', 'boottime', 'cold', {'open': 1, 'dlopen': 0, 'os': 0}),
+    ('linux', None, 'boottime', 'warm', {'open': 0, 'os': 0}),
+    # Helpers read at most one file each, and load at most one library
+    # (which may take a try for each name it goes by, e.g. libc.so and
+    # libc.dylib).
+    (None, None, 'helper', None, {'open': 1, 'dlopen': 2, 'os': 0}),
+]
+
+# Run in a fresh interpreter, with the name of the function filled in.
+CHILD = '''
+import json, sys
+sys.path.insert(0, ".")
+import src as uptime
+from src import _native, _procfs
+uptime._datetime()
+
+events = None
+def hook(event, args):
+    if events is not None:
+        events.append(event)
+sys.addaudithook(hook)
+
+func = getattr(uptime, %r)
+result = {}
+for phase in ("cold", "warm"):
+    events = []
+    func()
+    result[phase], events = events, None
+result["backend"] = uptime.backend()
+sys.stdout.write(json.dumps(result))
+'''
+
+
+def kind(event):
+    """Returns what kind of event this is for the budgets, or None."""
+    if event in SPAWN:
+        return 'subprocess'
+    if event == 'open':
+        return 'open'
+    if event == 'ctypes.dlopen':
+        return 'dlopen'
+    if event.startswith('os.'):
+        return 'os'
+    return None
+
+def count(events):
+    """Returns a dict mapping each kind of event to how often it happened."""
+    counts = {}
+    for event in events:
+        k = kind(event)
+        if k is not None:
+            counts[k] = counts.get(k, 0) + 1
+    return counts
+
+def limits(func, phase, backend, platform=sys.platform):
+    """Returns the combined budget for a call, as a dict of kind: limit."""
+    if func.startswith('_'):
+        func = 'helper'
+    result = {}
+    for plat, back, fn, ph, limit in BUDGETS:
+        if (plat is None or platform.startswith(plat)) and \
+           back in (None, backend) and fn in (None, func) and \
+           ph in (None, phase):
+            for k, n in limit.items():
+                result[k] = min(n, result.get(k, n))
+    return result
+
+def measure(func):
+    """
+    Calls uptime's func twice in a fresh interpreter, and returns a dict with
+    the events each call raised (under 'cold' and 'warm') and the backend
+    uptime() ended up with.
+    """
+    out = subprocess.Popen([sys.executable, '-c', CHILD % func],
+                           stdout=subprocess.PIPE).communicate()[0]
+    return json.loads(out.decode())
+
+def run(funcs=None):
+    """
+    Measures each of funcs (by default uptime, boottime and the helpers), and
+    returns (results, failures). results maps each function to what
+    measure() found; failures is a list of (function, phase, kind, count,
+    limit) for each budget that was exceeded.
+    """
+    if funcs is None:
+        funcs = ['uptime', 'boottime'] + helpers
+    results, failures = {}, []
+    for func in funcs:
+        res = results[func] = measure(func)
+        for phase in ('cold', 'warm'):
+            counts = count(res[phase])
+            for k, limit in limits(func, phase, res['backend']).items():
+                if counts.get(k, 0) > limit:
+                    failures.append((func, phase, k, counts[k], limit))
+    return results, failures
+
+def report(results, failures):
+    """Writes a human-readable summary to standard output."""
+    sys.stdout.write('Python %s on %s\n\n' % (sys.version.split()[0],
+                                               sys.platform))
+    kinds = ('open', 'dlopen', 'os', 'subprocess')
+    sys.stdout.write('%-20s %-6s %s\n' % ('', '', ' '.join('%10s' % k
+                                                          for k in kinds)))
+    for func in sorted(results):
+        for phase in ('cold', 'warm'):
+            counts = count(results[func][phase])
+            sys.stdout.write('%-20s %-6s %s\n' %
+                             (func if phase == 'cold' else '', phase,
+                              ' '.join('%10d' % counts.get(k, 0)
+                                       for k in kinds)))
+    for func, phase, k, n, limit in failures:
+        sys.stdout.write('\nOver budget: %s %s: %d %s (at most %d)' %
+                         (phase, func, n, k, limit))
+    if failures:
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    if not hasattr(sys, 'addaudithook'):
+        sys.stderr.write('Audit hooks required (Python 3.8+).\n')
+        sys.exit(1)
+
+    results, failures = run()
+
+    out = None
+    if '--json' in sys.argv:
+        out = sys.argv[sys.argv.index('--json') + 1]
+    if out == '-':
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        report(results, failures)
+        if out is not None:
+            f = open(out, 'w')
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.close()
+
+    if failures:
+        sys.exit(1)
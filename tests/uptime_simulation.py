@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+
+"""
+Simulated platforms for uptime. Run from the top of the source tree:
+
+    python tests/uptime_simulation.py
+
+Most of uptime's backends only do anything on their own platform, so on any
+one machine most of them are never really exercised. This makes a platform
+up: a fake file tree standing in for /proc, /dev/time and friends, and fake
+shared libraries whose functions are called through ctypes exactly like the
+real ones (same prototypes, same pointers to fill in), but answer from
+Python. uptime's own C extension is switched off, since it can't be fooled,
+and so is every real library.
+
+Run as a script, this checks that every simulated platform ends up with the
+right backend and the right answer, and times a cold probe (everything
+uptime tries before it gets there included) and warm calls on each.
+"""
+
+import ctypes
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, '.')
+
+import src as uptime
+from src import _native, _procfs
+
+
+# Every library name _native tries. The ones a simulation doesn't provide
+# fail to load.
+LIBRARIES = ('libc.so', 'libc.so.6', 'libc.dylib', 'libroot.so',
+             'libkstat.so', 'coredll.lib')
+
+# The helpers that live in uptime's C extension.
+EXTENSION = ('_uptime_clock', '_uptime_osx', '_uptime_posix',
+             '_uptime_sysinfo', '_sysinfo')
+
+
+class Library(object):
+    """
+    Stands in for a ctypes.CDLL. Each function is given as a (restype,
+    argtypes, implementation) tuple. The implementation is wrapped in a real
+    C function pointer with that prototype, and what the library hands out
+    is an unprototyped pointer to it, like CDLL does, so arguments get
+    converted the same way they would be for the real thing.
+    """
+    def __init__(self, name, **funcs):
+        self._name = name
+        self._callbacks = []
+        for fname, (restype, argtypes, impl) in funcs.items():
+            callback = ctypes.CFUNCTYPE(restype, *argtypes)(impl)
+            self._callbacks.append(callback)
+
+            class FuncPtr(ctypes._CFuncPtr):
+                _flags_ = ctypes._FUNCFLAG_CDECL
+                _restype_ = ctypes.c_int
+            setattr(self, fname,
+                    FuncPtr(ctypes.cast(callback, ctypes.c_void_p).value))
+
+
+class FakeOS(object):
+    """The os module, but with stat() looking in the fake file tree."""
+    def __init__(self, sim):
+        self.__sim = sim
+
+    def __getattr__(self, name):
+        return getattr(os, name)
+
+    def stat(self, path):
+        st = os.stat(self.__sim.path(path))
+        t = self.__sim.times.get(path)
+        if t is not None:
+            # Pretend it was created and last modified at boot.
+            st = os.stat_result(tuple(st)[:7] + (t, t, t))
+        return st
+
+
+class FakeSys(object):
+    """The sys module, but on another platform."""
+    def __init__(self, platform):
+        self.platform = platform
+
+    def __getattr__(self, name):
+        return getattr(sys, name)
+
+
+class Simulation(object):
+    """
+    A made-up platform that's been up for up seconds: the files and the
+    libraries it has, and which value of sys.platform. Call start() to make
+    uptime believe in it and stop() to undo that.
+    """
+    def __init__(self, platform, up, files=None, times=None, libs=()):
+        self.platform = platform
+        self.up = up
+        self.boot = time.time() - up
+        self.files = files or {}
+        self.times = times or {}
+        self.libs = dict((lib._name, lib) for lib in libs)
+        self.root = None
+        self.saved = None
+
+    def path(self, path):
+        """Where a path on the simulated system really is."""
+        if path in self.files or path in self.times:
+            return os.path.join(self.root, path.lstrip('/'))
+        # Anything else doesn't exist, as far as the simulation is
+        # concerned.
+        return os.path.join(self.root, 'nonexistent', path.lstrip('/'))
+
+    def open(self, path, mode='r'):
+        return open(self.path(path), mode)
+
+    def start(self):
+        self.root = tempfile.mkdtemp()
+        for path in set(self.files) | set(self.times):
+            real = self.path(path)
+            if not os.path.isdir(os.path.dirname(real)):
+                os.makedirs(os.path.dirname(real))
+            f = open(real, 'w')
+            f.write(self.files.get(path, ''))
+            f.close()
+
+        libs, funcs = vars(_native)['__libs'], vars(_native)['__funcs']
+        self.saved = (dict(libs), dict(funcs), uptime.os, uptime.sys,
+                      dict((name, getattr(uptime, name))
+                           for name in EXTENSION))
+        libs.clear()
+        funcs.clear()
+        for name in LIBRARIES:
+            libs[name] = self.libs.get(name)
+        vars(_procfs)['__btime'].clear()
+        _procfs.open = self.open
+        uptime.os = FakeOS(self)
+        uptime.sys = FakeSys(self.platform)
+        for name in EXTENSION:
+            setattr(uptime, name, lambda: None)
+        uptime.reset()
+
+    def stop(self):
+        libs, funcs, uptime.os, uptime.sys, extension = self.saved
+        vars(_native)['__libs'].clear()
+        vars(_native)['__libs'].update(libs)
+        vars(_native)['__funcs'].clear()
+        vars(_native)['__funcs'].update(funcs)
+        vars(_procfs)['__btime'].clear()
+        del _procfs.open
+        for name, func in extension.items():
+            setattr(uptime, name, func)
+        uptime.reset()
+        shutil.rmtree(self.root)
+        self.root = self.saved = None
+
+
+def linux(up):
+    """Linux with procfs."""
+    sim = Simulation('linux2', up)
+    sim.files = {'/proc/uptime': '%.2f %.2f\n' % (up, up * 3.5),
+                 '/proc/stat': 'cpu  1 2 3 4\nintr 5\nbtime %d\n'
+                               'processes 6\n' % sim.boot}
+    return sim
+
+def linux_sysinfo(up):
+    """Linux without procfs, so sysinfo() it is."""
+    def sysinfo(info):
+        # struct sysinfo starts with long uptime.
+        ctypes.c_long.from_address(info).value = int(up)
+        return 0
+    libc = Library('libc.so.6',
+                   sysinfo=(ctypes.c_int, [ctypes.c_void_p], sysinfo))
+    return Simulation('linux2', up, libs=[libc])
+
+def bsd(up):
+    """FreeBSD, with kern.boottime."""
+    sim = Simulation('freebsd8', up)
+
+    class timeval(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_usec', ctypes.c_long)]
+    boot = timeval(int(sim.boot), int(sim.boot % 1 * 1000000))
+
+    def sysctlbyname(name, oldp, oldlenp, newp, newlen):
+        if name != 'kern.boottime'.encode('ascii'):
+            return -1
+        if oldp:
+            if oldlenp[0] < ctypes.sizeof(boot):
+                return -1
+            ctypes.memmove(oldp, ctypes.addressof(boot), ctypes.sizeof(boot))
+        oldlenp[0] = ctypes.sizeof(boot)
+        return 0
+    sim.libs['libc.so'] = Library('libc.so', sysctlbyname=(
+        ctypes.c_int, [ctypes.c_char_p, ctypes.c_void_p,
+                       ctypes.POINTER(ctypes.c_size_t), ctypes.c_void_p,
+                       ctypes.c_size_t], sysctlbyname))
+    return sim
+
+def solaris(up):
+    """Solaris, with unix:0:system_misc:boot_time in kstat."""
+    sim = Simulation('sunos5', up)
+
+    # From sys/kstat.h.
+    class value(ctypes.Union):
+        _fields_ = [('c', ctypes.c_char * 16), ('i32', ctypes.c_int32),
+                    ('ui32', ctypes.c_uint32), ('i64', ctypes.c_int64),
+                    ('ui64', ctypes.c_uint64)]
+
+    class kstat_named_t(ctypes.Structure):
+        _fields_ = [('name', ctypes.c_char * 31),
+                    ('data_type', ctypes.c_ubyte),
+                    ('value', value)]
+
+    boot_time = kstat_named_t('boot_time'.encode('ascii'), 2)
+    boot_time.value.ui32 = int(sim.boot)
+    # Made-up handles for the kstat_ctl_t and the kstat_t.
+    KC, KSP = 0x1000, 0x2000
+
+    def kstat_lookup(kc, module, instance, name):
+        if kc == KC and module == 'unix'.encode('ascii') and \
+           instance == 0 and name == 'system_misc'.encode('ascii'):
+            return KSP
+        return None
+
+    def kstat_data_lookup(ksp, name):
+        if ksp == KSP and name == 'boot_time'.encode('ascii'):
+            return ctypes.addressof(boot_time)
+        return None
+
+    sim.libs['libkstat.so'] = Library(
+        'libkstat.so',
+        kstat_open=(ctypes.c_void_p, [], lambda: KC),
+        kstat_lookup=(ctypes.c_void_p, [ctypes.c_void_p, ctypes.c_char_p,
+                                        ctypes.c_int, ctypes.c_char_p],
+                      kstat_lookup),
+        kstat_read=(ctypes.c_int, [ctypes.c_void_p, ctypes.c_void_p,
+                                   ctypes.c_void_p],
+                    lambda kc, ksp, buf: 0 if ksp == KSP else -1),
+        kstat_data_lookup=(ctypes.c_void_p, [ctypes.c_void_p,
+                                             ctypes.c_char_p],
+                           kstat_data_lookup),
+        kstat_close=(ctypes.c_int, [ctypes.c_void_p], lambda kc: 0))
+    # Keep it alive as long as the library.
+    sim.libs['libkstat.so']._boot_time = boot_time
+    return sim
+
+def beos(up):
+    """Haiku, with system_time() in microseconds."""
+    libroot = Library('libroot.so', system_time=(
+        ctypes.c_int64, [], lambda: int(up * 1000000)))
+    return Simulation('haiku1', up, libs=[libroot])
+
+def windows(up):
+    """Windows CE, with GetTickCount64() in milliseconds."""
+    coredll = Library('coredll.lib', GetTickCount64=(
+        ctypes.c_uint64, [], lambda: int(up * 1000)))
+    return Simulation('wince', up, libs=[coredll])
+
+def plan9(up):
+    """Plan 9, which isn't a platform Python knows about."""
+    hz = 1000000
+    sim = Simulation('plan9', up)
+    sim.files = {'/dev/time': '%d %d %d %d' % (time.time(),
+                                               time.time() * 1e9,
+                                               up * hz, hz)}
+    return sim
+
+def minix(up):
+    """MINIX, whose /proc/uptime is just a number."""
+    return Simulation('minix3', up, files={'/proc/uptime': '%.2f' % up})
+
+def amiga(up):
+    """AmigaOS, where RAM: is created at boot."""
+    sim = Simulation('amiga', up)
+    sim.times = {'RAM:': sim.boot}
+    return sim
+
+def syllable(up):
+    """Syllable, whose first pty is created at boot."""
+    sim = Simulation('syllable', up)
+    sim.times = {'/dev/pty/mst/pty0': sim.boot}
+    return sim
+
+# Simulation, the backend uptime() should settle on, and how close the
+# answer has to be.
+SCENARIOS = [(linux, 'linux', 1),
+             (linux_sysinfo, 'linux', 1),
+             (bsd, 'bsd', 1e-3),
+             (solaris, 'solaris', 1),
+             (beos, 'beos', 1e-3),
+             (windows, 'windows', 1e-3),
+             (plan9, 'plan9', 1e-3),
+             (minix, 'minix', .01),
+             (amiga, 'amiga', 1),
+             (syllable, 'syllable', 1)]
+
+def check(scenario, up=123456.789):
+    """
+    Runs a scenario, and returns None if uptime() and boottime() came up with
+    the right answers from the right backend, or what went wrong if not.
+    """
+    make, backend, tolerance = scenario
+    sim = make(up)
+    sim.start()
+    try:
+        # The made-up uptime stands still while the real clock doesn't, so
+        # allow for however long it's been since the scenario was made.
+        slack = lambda: tolerance + time.time() - (sim.boot + sim.up)
+        got = uptime.uptime()
+        if uptime.backend() != backend:
+            return 'backend %s, not %s' % (uptime.backend(), backend)
+        if got is None or abs(got - sim.up) > slack():
+            return 'uptime %r, not %r' % (got, sim.up)
+        bt = uptime._boottime()
+        if bt is None or abs(bt - sim.boot) > slack():
+            return 'boot time %r, not %r' % (bt, sim.boot)
+        return None
+    finally:
+        sim.stop()
+
+def bench(scenario, up=123456.789, min_time=.1):
+    """
+    Returns how long a cold probe and a warm call to uptime() take on a
+    scenario's platform, in microseconds and nanoseconds respectively.
+    """
+    timer = getattr(time, 'perf_counter', time.time)
+    sim = scenario[0](up)
+    sim.start()
+    try:
+        cold, n = 0., 0
+        while cold < min_time:
+            uptime.reset()
+            t = timer()
+            uptime.uptime()
+            cold += timer() - t
+            n += 1
+        cold = cold / n * 1e6
+
+        uptime.uptime()
+        warm, n = 0., 0
+        while warm < min_time:
+            n += 1000
+            t = timer()
+            for i in range(1000):
+                uptime.uptime()
+            warm += timer() - t
+        warm = warm / n * 1e9
+        return cold, warm
+    finally:
+        sim.stop()
+
+
+if __name__ == '__main__':
+    failed = False
+    sys.stdout.write('%-16s %-10s %14s %14s\n' % ('', 'backend', 'cold (us)',
+                                                  'warm (ns)'))
+    for scenario in SCENARIOS:
+        name = scenario[0].__name__
+        problem = check(scenario)
+        if problem is not None:
+            failed = True
+            sys.stdout.write('%-16s %s\n' % (name, problem))
+            continue
+        cold, warm = bench(scenario)
+        sys.stdout.write('%-16s %-10s %14.1f %14.1f\n' % (name, scenario[1],
+                                                         cold, warm))
+    if failed:
+        sys.exit(1)
@@ -1,15 +1,34 @@
 #!/usr/bin/env python
 # coding: utf8
 
-import imp
+import json
+import os
+import shutil
+import subprocess
 import sys
+import tempfile
 import time
 from datetime import datetime
 import unittest
 
+try:
+    from importlib import reload
+except ImportError:
+    try:
+        from imp import reload
+    except ImportError:
+        pass
+
+try:
+    # io.StringIO only takes unicode on Python 2.
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 sys.path.insert(0, '.')
 
 import src as uptime
+from src import _native, _procfs
 
 
 boottime_helpers = [f for f in vars(uptime) if f.startswith('_boottime_')]
@@ -27,7 +46,7 @@ class NormalTest(unittest.TestCase):
         set as a side-effect by any function. To be on the safe side, just
         reload the whole module every time.
         """
-        imp.reload(uptime)
+        reload(uptime)
 
     def basic_test(self, func, rettypes):
         """
@@ -60,13 +79,17 @@ class BrokenCtypesTest(NormalTest):
     """
     @classmethod
     def setUpClass(cls):
-        uptime.ctypes = None
-        delattr(uptime, 'struct')
+        _native.ctypes = None
+        delattr(_native, 'struct')
         delattr(uptime, 'os')
 
+    @classmethod
+    def tearDownClass(cls):
+        reload(_native)
+
 class OtherTest(unittest.TestCase):
     def setUp(self):
-        imp.reload(uptime)
+        reload(uptime)
 
     def test_equality_guarantee(self):
         """
@@ -96,6 +119,898 @@ class OtherTest(unittest.TestCase):
         for h in boottime_helpers:
             self.assertRaises(RuntimeError, getattr(uptime, h))
 
+    def test_backend(self):
+        """
+        backend() should be None before the first probe, and name one of the
+        helpers afterwards if uptime() found an answer.
+        """
+        self.assertTrue(uptime.backend() is None)
+        up = uptime.uptime()
+        if up is None:
+            self.assertTrue(uptime.backend() is None)
+        else:
+            self.assertTrue('_uptime_%s' % uptime.backend() in uptime_helpers)
+
+    def test_probe_once(self):
+        """
+        Once a backend has answered, later calls shouldn't touch any of the
+        others.
+        """
+        if uptime.uptime() is None:
+            return
+        calls = []
+        for h in uptime_helpers:
+            if h != '_uptime_%s' % uptime.backend():
+                setattr(uptime, h, lambda h=h: calls.append(h))
+        uptime.uptime()
+        uptime.uptime()
+        self.assertEqual(calls, [])
+
+    def test_reset(self):
+        """
+        reset() should make the module forget what it found.
+        """
+        uptime.boottime()
+        uptime.reset()
+        self.assertTrue(uptime.backend() is None)
+        self.assertTrue(vars(uptime)['__boottime'] is None)
+        self.assertEqual(vars(_procfs)['__btime'], {})
+
+    def test_anchor(self):
+        """
+        In anchored mode, only the first call should probe, and stepping the
+        wall clock shouldn't change the answer.
+        """
+        if uptime._monotonic is None:
+            self.assertRaises(RuntimeError, uptime.anchor)
+            return
+        uptime.anchor()
+        up1 = uptime.uptime()
+        if up1 is None:
+            return
+        boot1 = uptime.boottime()
+
+        for h in uptime_helpers + boottime_helpers:
+            setattr(uptime, h, None)
+        real_time = time.time
+        time.time = lambda: real_time() + 3600
+        try:
+            up2 = uptime.uptime()
+            boot2 = uptime.boottime()
+        finally:
+            time.time = real_time
+
+        self.assertTrue(0 <= up2 - up1 < 60)
+        self.assertEqual(boot1, boot2)
+
+    def test_library_cache(self):
+        """
+        Each shared library should only be looked for once, whether or not
+        it can be found.
+        """
+        reload(_native)
+        if _native.ctypes is None:
+            return
+        loads = []
+        real_cdll = _native.ctypes.CDLL
+        def cdll(name):
+            loads.append(name)
+            return real_cdll(name)
+        _native.ctypes.CDLL = cdll
+        try:
+            for i in range(3):
+                for h in uptime_helpers:
+                    getattr(uptime, h)()
+                uptime.reset()
+        finally:
+            _native.ctypes.CDLL = real_cdll
+        self.assertEqual(sorted(loads), sorted(set(loads)))
+
+    def test_module_cache(self):
+        """
+        The platform modules _uptime_mac() and _uptime_riscos() need should
+        only be looked for once, whether or not they're there.
+        """
+        try:
+            import builtins
+        except ImportError:
+            import __builtin__ as builtins
+        imports = []
+        real_import = builtins.__import__
+        def import_(name, *args, **kwargs):
+            imports.append(name)
+            return real_import(name, *args, **kwargs)
+        uptime._MacOS = uptime._swi = uptime._UNLOADED
+        builtins.__import__ = import_
+        try:
+            for i in range(3):
+                uptime._uptime_mac()
+                uptime._uptime_riscos()
+        finally:
+            builtins.__import__ = real_import
+        self.assertEqual(sorted(imports), ['MacOS', 'swi'])
+
+    def test_lazy_imports(self):
+        """
+        Importing uptime shouldn't import ctypes, datetime or any of the
+        backend submodules; they're only loaded once something needs them.
+        """
+        lazy = ['ctypes', 'datetime', 'asyncio',
+                'src._native', 'src._procfs', 'src._aio', 'src._watch',
+                'src._snapshot']
+        out = subprocess.Popen(
+            [sys.executable, '-c',
+             'import sys; sys.path.insert(0, "."); import src; '
+             'print(" ".join(m for m in %r if m in sys.modules))' % lazy],
+            stdout=subprocess.PIPE).communicate()[0]
+        self.assertEqual(out.decode().split(), [])
+
+    def test_read_btime(self):
+        """
+        The btime reader should find btime wherever it is in the file, even
+        if it straddles two chunks, and stop reading once it has.
+        """
+        intr = 'intr ' + ' '.join(['0'] * 5000)
+        chunk = _procfs._CHUNK
+        try:
+            for head in ([], ['cpu  1 2 3'], ['cpu  1 2 3', intr]):
+                for tail in ([], ['processes 1234', '']):
+                    fd, path = tempfile.mkstemp()
+                    os.write(fd, '\n'.join(head + ['btime 1371828161'] +
+                                           tail).encode())
+                    os.close(fd)
+                    try:
+                        for size in list(range(1, 16)) + [chunk]:
+                            _procfs._CHUNK = size
+                            self.assertEqual(_procfs._read_btime(path),
+                                             1371828161)
+                    finally:
+                        os.unlink(path)
+        finally:
+            _procfs._CHUNK = chunk
+
+        fd, path = tempfile.mkstemp()
+        os.write(fd, intr.encode())
+        os.close(fd)
+        try:
+            self.assertTrue(_procfs._read_btime(path) is None)
+        finally:
+            os.unlink(path)
+
+    def test_process_times(self):
+        """
+        process_times() should find this process, agree with itself whether
+        or not it uses threads, and skip pids that don't exist.
+        """
+        if not os.path.exists('/proc/self/stat'):
+            return
+        start = time.time()
+        pid = os.getpid()
+        times = list(uptime.process_times([pid, -1]))
+        self.assertEqual(len(times), 1)
+        self.assertEqual(times[0][0], pid)
+        self.assertTrue(times[0][1] <= start + 1)
+        self.assertTrue(times[0][2] >= -1)
+        self.assertTrue(abs(times[0][1] + times[0][2] - time.time()) < 60)
+
+        serial = [t[0] for t in uptime.process_times()]
+        self.assertTrue(pid in serial)
+        try:
+            import concurrent.futures
+        except ImportError:
+            self.assertRaises(RuntimeError,
+                              lambda: list(uptime.process_times(workers=4)))
+            return
+        threaded = [t[0] for t in uptime.process_times(workers=4)]
+        self.assertTrue(pid in threaded)
+
+    def test_procfs_roots(self):
+        """
+        The procfs helpers should read from whatever root they're given.
+        """
+        roots = [tempfile.mkdtemp() for i in range(3)]
+        try:
+            for n, root in enumerate(roots[1:]):
+                f = open(os.path.join(root, 'uptime'), 'w')
+                f.write('%d.50 100.25\n' % (1000 + n))
+                f.close()
+                f = open(os.path.join(root, 'stat'), 'w')
+                f.write('cpu  1 2 3\nbtime %d\nprocesses 5\n' % (2000 + n))
+                f.close()
+                os.mkdir(os.path.join(root, '42'))
+                f = open(os.path.join(root, '42', 'stat'), 'w')
+                f.write('42 (a (weird) name) S' + ' 0' * 18 + ' %d 0\n' %
+                        (500 * _procfs.clock_ticks()))
+                f.close()
+
+            self.assertEqual(uptime._uptime_linux(roots[1]), 1000.5)
+            self.assertEqual(uptime._uptime_linux(roots[0]), None)
+            self.assertEqual(uptime._boottime_linux(roots[2]),
+                             datetime.fromtimestamp(2001))
+            self.assertTrue(vars(uptime)['__boottime'] is None)
+
+            expected = {roots[0]: (None, None),
+                        roots[1]: (1000.5, 2000),
+                        roots[2]: (1001.5, 2001)}
+            self.assertEqual(uptime.procfs_times(roots), expected)
+            try:
+                import concurrent.futures
+                self.assertEqual(uptime.procfs_times(roots, workers=3),
+                                 expected)
+            except ImportError:
+                self.assertRaises(RuntimeError, uptime.procfs_times, roots,
+                                  workers=3)
+
+            times = list(uptime.process_times(procfs=roots[1]))
+            self.assertEqual([t[0] for t in times], [42])
+            self.assertEqual(times[0][2], 500.5)
+        finally:
+            for root in roots:
+                shutil.rmtree(root)
+
+    def test_async(self):
+        """
+        Concurrent async_uptime() calls on a cold module should share a
+        single probe, and agree with the synchronous functions.
+        """
+        if sys.version_info < (3, 5):
+            return
+        import asyncio
+
+        probes = []
+        real_probe = uptime._probe
+        def probe():
+            probes.append(1)
+            time.sleep(.05)
+            return real_probe()
+        uptime._probe = probe
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            ups = loop.run_until_complete(
+                asyncio.gather(*[uptime.async_uptime() for i in range(20)]))
+            boot = loop.run_until_complete(uptime.async_boottime())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+        self.assertEqual(len(probes), 1)
+        self.assertEqual(len(set(ups)), 1)
+        if ups[0] is None:
+            self.assertTrue(boot is None)
+        else:
+            self.assertTrue(abs(ups[0] - uptime.uptime()) < 60)
+            self.assertEqual(boot, uptime.boottime())
+
+    def test_async_backend(self):
+        """
+        Once it's settled on a backend that reads a file, async_uptime()
+        should keep reading it in the executor, boot time known or not.
+        """
+        if sys.version_info < (3, 5) or uptime._uptime_linux() is None:
+            return
+        import asyncio
+        import threading
+
+        threads = []
+        real_clock, real_uptime_linux = uptime._uptime_clock, \
+                                        _procfs.uptime_linux
+        def uptime_linux(*args):
+            threads.append(threading.current_thread())
+            return real_uptime_linux(*args)
+
+        loop = asyncio.new_event_loop()
+        try:
+            # As if the extension hadn't been built.
+            uptime._uptime_clock = lambda: None
+            uptime.boottime()
+            self.assertEqual(uptime.backend(), 'linux')
+            _procfs.uptime_linux = uptime_linux
+            up = loop.run_until_complete(uptime.async_uptime())
+        finally:
+            uptime._uptime_clock = real_clock
+            _procfs.uptime_linux = real_uptime_linux
+            loop.close()
+            uptime.reset()
+
+        self.assertTrue(up > 0)
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0] is not threading.current_thread())
+
+    def test_single_flight(self):
+        """
+        When lots of threads call uptime() on a cold module at once, only one
+        of them should probe, and all of them should get its answer.
+        """
+        import threading
+
+        probes = []
+        def helper():
+            # Calling the backend once it's been found isn't probing.
+            if uptime.backend() is None:
+                probes.append(1)
+            time.sleep(.05)
+            vars(uptime)['__boottime'] = time.time() - 1000
+            return 1000.
+        for h in uptime_helpers:
+            setattr(uptime, h, helper)
+
+        ups = []
+        threads = [threading.Thread(target=lambda: ups.append(uptime.uptime()))
+                   for i in range(64)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(probes), 1)
+        self.assertEqual(len(ups), 64)
+        self.assertTrue(all(1000 <= up < 1060 for up in ups))
+
+    def test_instrument(self):
+        """
+        With instrumentation on, every backend uptime() calls should show up
+        in stats() and be passed to the hook; with it off, nothing should.
+        """
+        events = []
+        uptime.instrument(hook=lambda *args: events.append(args))
+        up = uptime.uptime()
+        uptime.uptime()
+        st = uptime.stats()
+
+        self.assertEqual(len(events), sum(s['calls'] for s in st.values()))
+        for name, seconds, result, error in events:
+            self.assertTrue('_uptime_%s' % name in uptime_helpers)
+            self.assertTrue(seconds >= 0)
+            self.assertEqual(error is None, bool(result))
+        for name, s in st.items():
+            self.assertTrue(s['max'] <= s['total'])
+            if name != uptime.backend():
+                self.assertEqual(s['calls'], s['failures'])
+                self.assertEqual(s['error'], 'no answer')
+        if up is not None and vars(uptime)['__boottime'] is None:
+            self.assertEqual(st[uptime.backend()]['calls'], 2)
+
+        uptime.instrument(False)
+        uptime.uptime()
+        self.assertEqual(uptime.stats(), {})
+        self.assertEqual(len(events), sum(s['calls'] for s in st.values()))
+
+    def test_instrument_reentrant(self):
+        """
+        A hook that calls back into the module shouldn't deadlock, even while
+        the module's probing, nor hear about its own calls.
+        """
+        import threading
+        heard = []
+        uptime.instrument(hook=lambda *args: heard.append(uptime.uptime()))
+        try:
+            t = threading.Thread(target=uptime.uptime)
+            t.daemon = True
+            t.start()
+            t.join(10)
+            self.assertFalse(t.is_alive())
+            # Only about the calls uptime() made, not the hook's own.
+            calls = sum(s['calls'] for s in uptime.stats().values())
+            self.assertTrue(0 < len(heard) <= calls)
+        finally:
+            uptime.instrument(False)
+
+    def test_watch(self):
+        """
+        python -m uptime --watch should keep printing lines, one interval
+        apart.
+        """
+        if not hasattr(os, 'symlink') or uptime.uptime() is None:
+            return
+        # The package is called uptime once it's installed.
+        path = tempfile.mkdtemp()
+        os.symlink(os.path.abspath('src'), os.path.join(path, 'uptime'))
+        env = dict(os.environ, PYTHONPATH=path)
+        proc = subprocess.Popen([sys.executable, '-m', 'uptime',
+                                 '--watch', '.1', '--json'],
+                                stdout=subprocess.PIPE, env=env)
+        try:
+            lines = [proc.stdout.readline() for i in range(4)]
+        finally:
+            proc.terminate()
+            proc.wait()
+            proc.stdout.close()
+            shutil.rmtree(path)
+
+        ups = [json.loads(l.decode())['uptime'] for l in lines]
+        for a, b in zip(ups, ups[1:]):
+            self.assertTrue(.05 < b - a < .5)
+        bt = json.loads(lines[0].decode())['boottime']
+        self.assertTrue(abs(bt - uptime._boottime()) < 2)
+
+    def test_write_metrics(self):
+        """
+        write_metrics() should leave exactly one file behind, holding what
+        metrics() says.
+        """
+        path = tempfile.mkdtemp()
+        prom = os.path.join(path, 'uptime.prom')
+        try:
+            for i in range(2):
+                if not uptime.write_metrics(prom):
+                    self.assertTrue(uptime.metrics() is None)
+                    return
+            self.assertEqual(os.listdir(path), ['uptime.prom'])
+            f = open(prom)
+            text = f.read()
+            f.close()
+        finally:
+            shutil.rmtree(path)
+
+        lines = text.splitlines()
+        self.assertEqual(lines[-1], '# EOF')
+        values = dict(l.split() for l in lines if not l.startswith('#'))
+        boot = float(values['node_boot_time_seconds'])
+        up = float(values['uptime_seconds'])
+        self.assertTrue(abs(boot + up - time.time()) < 60)
+
+    def test_serve(self):
+        """
+        serve() should answer /metrics and /uptime.json without probing
+        again, and count the requests it has answered.
+        """
+        try:
+            from urllib.request import urlopen
+        except ImportError:
+            from urllib2 import urlopen
+
+        server = uptime.serve(0, '127.0.0.1', block=False)
+        if server is None:
+            self.assertTrue(uptime.uptime() is None)
+            return
+        for h in uptime_helpers + boottime_helpers:
+            setattr(uptime, h, None)
+        url = 'http://127.0.0.1:%d' % server.server_address[1]
+        try:
+            data = json.loads(urlopen(url + '/uptime.json').read().decode())
+            text = urlopen(url + '/metrics').read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertTrue(abs(data['boottime'] + data['uptime'] - time.time())
+                        < 60)
+        self.assertTrue('uptime_http_request_duration_seconds_count 1\n'
+                        in text)
+        self.assertTrue(text.endswith('# EOF\n'))
+
+    def test_format_uptime(self):
+        """
+        format_uptime() should say the same thing for one number, a list of
+        them, or a NumPy array of them.
+        """
+        ups = [0, 1, 61.5, 3600, 90061.25, 2 * 86400 + 7200]
+        verbose = ['0.00 seconds', '1.00 seconds', '1 minute, 1.50 seconds',
+                   '1 hour', '1 day, 1 hour, 1 minute, 1.25 seconds',
+                   '2 days, 2 hours']
+        compact = ['0s', '1s', '1m 1s', '1h', '1d 1h 1m 1s', '2d 2h']
+
+        self.assertEqual([uptime.format_uptime(up) for up in ups], verbose)
+        self.assertEqual(uptime.format_uptime(ups), verbose)
+        self.assertEqual(uptime.format_uptime(tuple(ups), 'compact'), compact)
+        self.assertEqual(uptime.format_uptime([None]), [None])
+        self.assertRaises(ValueError, uptime.format_uptime, 1, 'wordy')
+
+        try:
+            import numpy
+        except ImportError:
+            return
+        self.assertEqual(uptime.format_uptime(numpy.array(ups)), verbose)
+        self.assertEqual(uptime.format_uptime(numpy.array(ups), 'compact'),
+                         compact)
+        self.assertEqual(uptime.format_uptime(numpy.array([61, numpy.nan])),
+                         ['1 minute, 1.00 seconds', None])
+        self.assertRaises(ValueError, uptime.format_uptime,
+                          numpy.array([ups, ups]))
+
+    def write_wtmp(self, path):
+        """
+        Writes a wtmp file with boots at 1010.5 and 1599, a run level change
+        and a shutdown, and a lot of logins, and returns True, or returns
+        False if this isn't a platform we know how to do that on.
+        """
+        if uptime._posix is None:
+            return False
+        # This is glibc's struct utmpx on x86-64 and most other 64-bit
+        # Linuxes; the tests don't know how to write it anywhere else.
+        import struct
+        utmpx = struct.Struct('hxxi32s4s32s256shhiii16s20x')
+        if not sys.platform.startswith('linux') or utmpx.size != 384:
+            return False
+
+        def record(ut_type, user, when, pid=0):
+            return utmpx.pack(ut_type, pid, b'~', b'~~', user, b'', 0, 0, 0,
+                              int(when), int(when % 1 * 1000000), b'')
+
+        BOOT_TIME, RUN_LVL, USER_PROCESS = 2, 1, 7
+        records = [record(USER_PROCESS, b'user', 1000 + i) for i in range(600)]
+        records[10] = record(BOOT_TIME, b'reboot', 1010.5)
+        records[11] = record(RUN_LVL, b'runlevel', 1011, ord('N') * 256 + 53)
+        records[400] = record(RUN_LVL, b'shutdown', 1400, 48)
+        records[599] = record(BOOT_TIME, b'reboot', 1599)
+
+        f = open(path, 'wb')
+        f.write(b''.join(records))
+        f.close()
+        return True
+
+    def test_boot_history(self):
+        """
+        boot_history() should pick the boot, shutdown and run level records
+        out of a wtmp file, across batches, and skip the rest.
+        """
+        d = tempfile.mkdtemp()
+        try:
+            path = os.path.join(d, 'wtmp')
+            if not self.write_wtmp(path):
+                return
+
+            history = uptime.boot_history(path)
+            self.assertEqual(next(history), ('boot', 1010.5, None))
+            self.assertEqual(list(history), [('runlevel', 1011., '5'),
+                                             ('shutdown', 1400., None),
+                                             ('boot', 1599., None)])
+            self.assertEqual(list(history), [])
+            self.assertRaises(OSError, uptime.boot_history,
+                              os.path.join(d, 'nope'))
+        finally:
+            shutil.rmtree(d)
+
+    def test_boot_index(self):
+        """
+        A boot index should put timestamps in the right boot session, for one
+        timestamp, a list or a NumPy array, and survive being saved.
+        """
+        from src import _sessions
+        index = _sessions.build([1599, 1010.5, 2000], 2003)
+        self.assertEqual(list(index.epochs), [1010.5, 1599, 2003])
+
+        self.assertEqual(index.lookup(1600), (1, 1))
+        self.assertEqual(index.lookup(5), (-1, None))
+        self.assertEqual(index.lookup([5, 1010.5, 2002, 3003]),
+                         ([-1, 0, 1, 2], [None, 0, 403, 1000]))
+
+        d = tempfile.mkdtemp()
+        try:
+            path = os.path.join(d, 'index')
+            index.save(path)
+            self.assertEqual(list(uptime.load_boot_index(path).epochs),
+                             list(index.epochs))
+            self.assertRaises(ValueError, uptime.load_boot_index, __file__)
+
+            path = os.path.join(d, 'wtmp')
+            if self.write_wtmp(path):
+                self.assertEqual(list(uptime.boot_index(path).epochs),
+                                 [1010.5, 1599])
+        finally:
+            shutil.rmtree(d)
+
+        try:
+            import numpy
+        except ImportError:
+            return
+        sessions, since = index.lookup(numpy.array([5, 1010.5, 2002, 3003]))
+        self.assertEqual(sessions.tolist(), [-1, 0, 1, 2])
+        self.assertTrue(numpy.isnan(since[0]))
+        self.assertEqual(since[1:].tolist(), [0, 403, 1000])
+
+    def test_ns(self):
+        """
+        uptime_ns() and boottime_ns() should return ints that agree with
+        uptime() and boottime(), whatever uptime() has found out so far.
+        """
+        bt = uptime._boottime()
+        bt_ns = uptime.boottime_ns()
+        up = uptime.uptime()
+        up_ns = uptime.uptime_ns()
+        if up is None:
+            self.assertEqual(up_ns, None)
+            self.assertEqual(bt_ns, None)
+            return
+
+        self.assertTrue(isinstance(up_ns, int))
+        self.assertTrue(isinstance(bt_ns, int))
+        self.assertTrue(abs(up_ns / 1e9 - up) < .01)
+        if uptime.backend() == 'clock' and hasattr(time, 'time_ns'):
+            # Exact, where boottime() may only know it to the second (from
+            # /proc/stat's btime).
+            self.assertTrue(abs(bt_ns / 1e9 - bt) < 1)
+            self.assertTrue(abs(time.time_ns() - uptime.uptime_ns() - bt_ns)
+                            < 10000000)
+        else:
+            self.assertEqual(bt_ns % 1000, 0)
+            self.assertTrue(abs(bt_ns / 1e9 - bt) < 1e-6)
+
+        if uptime._monotonic is not None:
+            uptime.anchor()
+            try:
+                up = uptime.uptime()
+                up_ns = uptime.uptime_ns()
+                self.assertTrue(abs(up_ns / 1e9 - up) < .01)
+                self.assertTrue(abs(uptime.boottime_ns() - bt_ns) < 10000000)
+            finally:
+                uptime.anchor(False)
+
+        # Without a clock, it's uptime() in nanoseconds.
+        clock_ns, func = uptime._clock_ns, uptime.uptime
+        try:
+            uptime._clock_ns = lambda: None
+            uptime.uptime = lambda: 1234.56
+            self.assertEqual(uptime.uptime_ns(), 1234560000000)
+        finally:
+            uptime._clock_ns, uptime.uptime = clock_ns, func
+
+    def test_persist(self):
+        """
+        With persist() on, a fresh start should pick up the backend and boot
+        time from the cache file without probing, but only on the same boot.
+        """
+        from src import _persist
+        if _persist.boot_id() is None:
+            self.assertFalse(uptime.persist())
+            return
+
+        d = tempfile.mkdtemp()
+        try:
+            # Somewhere it can't be written.
+            path = os.path.join(d, 'missing', 'uptime.cache')
+            self.assertFalse(uptime.persist(path=path))
+            self.assertTrue(vars(uptime)['__persist'] is None)
+
+            path = os.path.join(d, 'uptime.cache')
+            uptime.reset()
+            self.assertTrue(uptime.persist(path=path))
+            if uptime.uptime() is None:
+                return
+            name = uptime.backend()
+            self.assertTrue(os.path.exists(path))
+            uptime._boottime()
+            bt = uptime._boottime()
+
+            # As if in a new process: one call to the cached backend, to
+            # check the boot time against, and no probing.
+            uptime.reset()
+            uptime.instrument()
+            uptime.persist(path=path)
+            self.assertEqual(uptime.backend(), name)
+            self.assertEqual(list(uptime.stats()), [name])
+            self.assertEqual(uptime.stats()[name]['calls'], 1)
+            self.assertEqual(uptime._boottime(), bt)
+
+            # The clock has been set since the file was written.
+            f = open(path, 'w')
+            f.write('%s %s %s %r\n' % (_persist.MAGIC, _persist.boot_id(),
+                                       name, bt - 3600))
+            f.close()
+            uptime.reset()
+            uptime.persist(path=path)
+            up = getattr(uptime, '_uptime_' + name)()
+            self.assertTrue(abs(uptime.uptime() - up) < 1)
+            self.assertTrue(abs(uptime._boottime() - bt) < 2)
+            self.assertEqual(_persist.load(path, _persist.boot_id(), [name]),
+                             (name, uptime._boottime()))
+
+            # Another boot.
+            f = open(path, 'w')
+            f.write('%s not-this-boot %s %r\n' % (_persist.MAGIC, name, bt))
+            f.close()
+            uptime.reset()
+            uptime.persist(path=path)
+            self.assertEqual(uptime.backend(), None)
+        finally:
+            uptime.persist(False)
+            uptime.instrument(False)
+            uptime.reset()
+            shutil.rmtree(d)
+
+    def test_budgets(self):
+        """
+        uptime() and boottime() should stay within their budgets of files
+        opened, libraries loaded and processes started; see uptime_budgets.py.
+        """
+        if not hasattr(sys, 'addaudithook'):
+            return
+        import uptime_budgets
+        results, failures = uptime_budgets.run(['uptime', 'boottime'])
+        self.assertEqual(failures, [])
+
+        # And it should notice when they don't.
+        self.assertEqual(uptime_budgets.count(['open', 'os.listdir',
+                                               'subprocess.Popen', 'os.fork',
+                                               'ctypes.dlopen', 'exec']),
+                         {'open': 1, 'os': 1, 'subprocess': 2, 'dlopen': 1})
+        self.assertEqual(uptime_budgets.limits('uptime', 'warm', 'clock',
+                                               'linux'),
+                         {'subprocess': 0, 'dlopen': 0, 'open': 0, 'os': 0})
+
+    def test_simulation(self):
+        """
+        Every backend should give the right answer on a simulation of its
+        platform; see uptime_simulation.py.
+        """
+        try:
+            import ctypes
+        except ImportError:
+            return
+        import uptime_simulation
+        for scenario in uptime_simulation.SCENARIOS:
+            self.assertEqual((scenario[0].__name__,
+                              uptime_simulation.check(scenario)),
+                             (scenario[0].__name__, None))
+
+    def test_subinterpreters(self):
+        """
+        The _posix extension should work in a subinterpreter, alongside its
+        copy in the main one.
+        """
+        try:
+            import _xxsubinterpreters as interpreters
+        except ImportError:
+            return
+        if uptime._posix is None:
+            return
+        history = uptime._posix._boot_history('/dev/null')
+        interp = interpreters.create()
+        try:
+            interpreters.run_string(interp, '\n'.join([
+                'import sys',
+                'sys.path.insert(0, %r)' % os.path.abspath('.'),
+                'from src import _posix',
+                '_posix._uptime_posix(), _posix._uptime_clock()',
+                'assert list(_posix._boot_history("/dev/null")) == []']))
+        finally:
+            interpreters.destroy(interp)
+        self.assertEqual(list(history), [])
+
+    def test_watch_clock(self):
+        """
+        The clock watcher should tell a suspend from the clock being set,
+        forget the boot time and anchor either way, and tell every callback,
+        even if one of them fails.
+        """
+        from src import _watch
+        heard = []
+        callbacks = vars(uptime)['__watch_callbacks']
+        callbacks[:] = [lambda *args: 1 / 0,
+                        lambda *args: heard.append(args)]
+        w = _watch.Watcher(None, None, uptime._clock_changed)
+        real_offsets, real_stderr = _watch.offsets, sys.stderr
+        if uptime._monotonic is not None:
+            uptime.anchor()
+        try:
+            for last, now, events in (
+                    ((10., 5.), (10., 5.), [('clock', 0.)]),
+                    ((10., 5.), (40., 5.), [('clock', 30.)]),
+                    ((10., 5.), (70., 65.), [('suspend', 60.)]),
+                    ((10., 5.), (60., 65.), [('suspend', 60.),
+                                             ('clock', -10.)])):
+                if uptime.uptime() is not None:
+                    uptime._boottime()
+                del heard[:]
+                w.last = last
+                _watch.offsets = lambda clock: now
+                sys.stderr = StringIO()
+                w.check()
+                self.assertTrue('ZeroDivisionError' in sys.stderr.getvalue())
+                sys.stderr = real_stderr
+                self.assertEqual([(e, round(s, 6)) for e, s in heard], events)
+                self.assertEqual(w.last, now)
+                self.assertTrue(vars(uptime)['__anchor'] is None)
+                self.assertTrue(vars(uptime)['__boottime'] is None)
+        finally:
+            _watch.offsets, sys.stderr = real_offsets, real_stderr
+            del callbacks[:]
+            uptime.anchor(False)
+            uptime.reset()
+
+        # Stopping from a callback, as unwatch() in one would: the thread
+        # closes its descriptors itself once the callback's returned.
+        if uptime._monotonic is not None:
+            pipes, stopped = [], []
+            def watch_fd():
+                pipes.append(os.pipe())
+                return pipes[-1][0]
+            def changed(event, seconds):
+                w.stop()
+                os.fstat(w.stop_r)
+                stopped.append(event)
+            w = _watch.Watcher(watch_fd, time.time, changed)
+            self.assertTrue(w.start())
+            os.write(pipes[0][1], '.'.encode('ascii'))
+            w.thread.join(5)
+            self.assertFalse(w.thread.is_alive())
+            self.assertEqual(stopped, ['clock'])
+            for fd in (w.fd, w.stop_r, w.stop_w):
+                self.assertRaises(OSError, os.fstat, fd)
+            for r, wr in pipes:
+                os.close(wr)
+
+            # If the timer can't be replaced, the thread gives up, and
+            # watch() doesn't go on saying it's watching.
+            pipes = []
+            def watch_fd():
+                if pipes:
+                    return None
+                pipes.append(os.pipe())
+                return pipes[-1][0]
+            w = _watch.Watcher(watch_fd, time.time, changed)
+            self.assertTrue(w.start())
+            os.write(pipes[0][1], '.'.encode('ascii'))
+            w.thread.join(5)
+            self.assertFalse(w.thread.is_alive())
+            self.assertTrue(w.closed)
+            os.close(pipes[0][1])
+            vars(uptime)['__watcher'] = w
+            try:
+                if uptime.watch():
+                    self.assertFalse(vars(uptime)['__watcher'].closed)
+                else:
+                    self.assertTrue(vars(uptime)['__watcher'] is None)
+                self.assertFalse(vars(uptime)['__watcher'] is w)
+            finally:
+                uptime.unwatch()
+
+        # The real thing, if this system has it.
+        if not uptime.watch():
+            return
+        try:
+            self.assertTrue(uptime.watch(heard.append))
+            self.assertEqual(callbacks, [heard.append])
+            uptime.unwatch(heard.append)
+            self.assertEqual(callbacks, [])
+        finally:
+            uptime.unwatch()
+        self.assertTrue(vars(uptime)['__watcher'] is None)
+
+    def test_snapshot(self):
+        """
+        snapshot() should get everything it can out of procfs, and leave
+        whatever it can't get as None.
+        """
+        d = tempfile.mkdtemp()
+        try:
+            for name, text in (('uptime', '1000.50 3000.25\n'),
+                               ('loadavg', '0.50 0.25 0.10 1/123 4567\n'),
+                               ('stat', 'cpu  40 0 20 140 0 0 0 0 0 0\n'
+                                        'cpu0 10 0 10 80 0 0 0 0 0 0\n'
+                                        'cpu1 30 0 10 50 10 0 0 0 0 0\n'
+                                        'intr 1 2 3\n'
+                                        'btime 1371828161\n'
+                                        'processes 1234\n')):
+                f = open(os.path.join(d, name), 'w')
+                f.write(text)
+                f.close()
+            snap = uptime.snapshot(d)
+            self.assertEqual((snap.uptime, snap.idle, snap.idle_ratios,
+                              snap.load, snap.boottime),
+                             (1000.5, 3000.25, (.8, .6), (.5, .25, .1),
+                              1371828161))
+            self.assertRaises(AttributeError, setattr, snap, 'other', 1)
+
+            os.remove(os.path.join(d, 'loadavg'))
+            os.remove(os.path.join(d, 'stat'))
+            snap = uptime.snapshot(d)
+            self.assertEqual((snap.uptime, snap.load, snap.idle_ratios),
+                             (1000.5, None, None))
+            # What btime was the last time it was read.
+            self.assertEqual(snap.boottime, 1371828161)
+
+            os.remove(os.path.join(d, 'uptime'))
+            self.assertEqual(uptime.snapshot(d), None)
+        finally:
+            shutil.rmtree(d)
+
+        snap = uptime.snapshot()
+        if snap is not None:
+            self.assertTrue(snap.uptime > 0)
+
 
 def run_suite(suite):
     """
@@ -155,5 +1070,33 @@ if __name__ == '__main__':
     # Other tests
     tests.addTest(OtherTest('test_equality_guarantee'))
     tests.addTest(OtherTest('test_broken_datetime'))
+    tests.addTest(OtherTest('test_backend'))
+    tests.addTest(OtherTest('test_probe_once'))
+    tests.addTest(OtherTest('test_reset'))
+    tests.addTest(OtherTest('test_anchor'))
+    tests.addTest(OtherTest('test_library_cache'))
+    tests.addTest(OtherTest('test_module_cache'))
+    tests.addTest(OtherTest('test_lazy_imports'))
+    tests.addTest(OtherTest('test_read_btime'))
+    tests.addTest(OtherTest('test_process_times'))
+    tests.addTest(OtherTest('test_procfs_roots'))
+    tests.addTest(OtherTest('test_async'))
+    tests.addTest(OtherTest('test_async_backend'))
+    tests.addTest(OtherTest('test_single_flight'))
+    tests.addTest(OtherTest('test_instrument'))
+    tests.addTest(OtherTest('test_instrument_reentrant'))
+    tests.addTest(OtherTest('test_watch'))
+    tests.addTest(OtherTest('test_write_metrics'))
+    tests.addTest(OtherTest('test_serve'))
+    tests.addTest(OtherTest('test_format_uptime'))
+    tests.addTest(OtherTest('test_boot_history'))
+    tests.addTest(OtherTest('test_boot_index'))
+    tests.addTest(OtherTest('test_ns'))
+    tests.addTest(OtherTest('test_persist'))
+    tests.addTest(OtherTest('test_budgets'))
+    tests.addTest(OtherTest('test_simulation'))
+    tests.addTest(OtherTest('test_subinterpreters'))
+    tests.addTest(OtherTest('test_watch_clock'))
+    tests.addTest(OtherTest('test_snapshot'))
 
     run_suite(tests)